@@ -0,0 +1,130 @@
+"""Caches of data read from storage.
+
+"""
+from collections import OrderedDict
+import copy
+import threading
+
+import pandas as pd
+
+from .utils import estimate_size
+
+
+class ReadCache:
+    """A least-recently-used cache of data read from storage.
+
+    Entries are indexed by the path of the data and by a version (e.g. the last
+    update time), so that outdated data is never returned. The cache is bounded
+    by the total size of its entries, in bytes.
+
+    Cached data is shared: readers get copies of it, see `reader_copy`.
+    """
+
+    def __init__(self, max_bytes=0):
+        """Initialize the cache.
+
+        Args:
+            max_bytes (int): Maximum total size of cached data, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, version):
+        """Return cached data.
+
+        Args:
+            path (str): Path of the data.
+            version: Version of the data.
+
+        Returns:
+            tuple: Whether the data was found, and the data (None if missing).
+        """
+        with self._lock:
+            if (path, version) not in self._entries:
+                return False, None
+            self._entries.move_to_end((path, version))
+            data, _ = self._entries[(path, version)]
+            return True, data
+
+    def put(self, path, version, data):
+        """Add data to the cache, evicting least recently used data if needed.
+
+        Data larger than the cache is not cached. Other versions of the same
+        path are removed.
+
+        Args:
+            path (str): Path of the data.
+            version: Version of the data.
+            data: The data to cache.
+        """
+        size = estimate_size(data)
+        with self._lock:
+            self._invalidate(path)
+            if size > self.max_bytes:
+                return
+            self._entries[(path, version)] = (data, size)
+            self.num_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        """Change the maximum size of the cache, evicting data if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, path):
+        """Remove all versions of a path from the cache.
+        """
+        with self._lock:
+            self._invalidate(path)
+
+    def clear(self):
+        """Remove all data from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def _invalidate(self, path):
+        for entry_path, version in list(self._entries):
+            if entry_path == path:
+                _, size = self._entries.pop((entry_path, version))
+                self.num_bytes -= size
+
+    def _evict(self):
+        while self.num_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.num_bytes -= size
+
+
+def _copy_on_write():
+    """Tell whether pandas copies data lazily, on first write.
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return bool(pd.get_option("mode.copy_on_write"))
+    except KeyError:
+        return False
+
+
+def reader_copy(data):
+    """Return a copy of cached data that a reader can modify.
+
+    With pandas copy-on-write, pandas objects are copied lazily, so that
+    their memory is only duplicated where readers modify them. Otherwise,
+    and for other data, copies are deep.
+
+    Args:
+        data: The cached data.
+    """
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.copy(deep=not _copy_on_write())
+    return copy.deepcopy(data)
+
+
+# The cache shared by all datasets of the process
+read_cache = ReadCache()
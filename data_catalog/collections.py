@@ -1,8 +1,15 @@
 """Collections of datasets.
 
 """
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
 from pathlib import PurePath
-import uuid
+import functools
+import hashlib
+import threading
+import time
 import inspect
 
 from .abc import (
@@ -12,7 +19,8 @@ from .abc import (
     is_collection,
     is_collection_filter,
 )
-from .file_systems import create_filesystem_from_uri
+from .file_systems import PooledFileSystemMixin, get_filesystem_from_uri
+from .utils import _freeze
 
 
 class MetaCollection(ABCMetaCollection):
@@ -30,13 +38,23 @@ class MetaCollection(ABCMetaCollection):
             msg = f"These attributes are missing: {missing_attributes}."
             raise ValueError(msg)
 
-        # Validate the keys attribute
+        # Validate the keys attribute, and let its results be cached
         _validate_keys_method(attrs["keys"])
+        attrs["keys"] = _cache_keys_method(attrs["keys"])
 
         # Set path in catalog from module path, if not set
         if "_catalog_module" not in attrs:
             attrs["_catalog_module"] = attrs["__module__"]
 
+        # Each collection class has its own cache of item classes, unless it
+        # shares the cache of another collection (see CollectionFilter)
+        if "_item_classes" not in attrs:
+            attrs["_item_classes"] = OrderedDict()
+            attrs["_item_classes_lock"] = threading.Lock()
+
+        # Cache of collections filtered from this one, see CollectionFilter
+        attrs["_filtered_collections"] = {}
+
         return super().__new__(mcs, name, bases, attrs)
 
     def __hash__(self):
@@ -70,6 +88,108 @@ def _validate_keys_method(keys):
         raise TypeError("The keys attribute must be a callable.")
 
 
+class KeysCache:
+    """A cache of collection keys.
+
+    Keys are cached per collection and context. The cache is used by
+    collections while it is active, see `caching_keys`.
+    """
+
+    def __init__(self, ttl=None):
+        """Initialize the cache.
+
+        Args:
+            ttl (float): Time in seconds after which cached keys expire. If
+              None, cached keys do not expire.
+        """
+        self.ttl = ttl
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection, list_keys):
+        """Return the keys of a collection, listing them only if not cached.
+
+        Args:
+            collection (AbstractCollection): The collection instance.
+            list_keys (callable): Function without arguments, returning the
+              keys of the collection.
+        """
+        cache_key = (collection.catalog_path(), _freeze(collection.context))
+        with self._lock:
+            if cache_key in self._keys:
+                creation_time, keys = self._keys[cache_key]
+                age = time.monotonic() - creation_time
+                if self.ttl is None or age < self.ttl:
+                    return keys
+
+        keys = list_keys()
+        with self._lock:
+            self._keys[cache_key] = (time.monotonic(), keys)
+        return keys
+
+    def invalidate(self, collection=None):
+        """Remove keys from the cache.
+
+        Args:
+            collection (AbstractCollection): The collection (class or instance)
+              of which keys must be removed, in all contexts. If None, the
+              cache is emptied.
+        """
+        with self._lock:
+            if collection is None:
+                self._keys.clear()
+            else:
+                catalog_path = collection.catalog_path()
+                for cache_key in list(self._keys):
+                    if cache_key[0] == catalog_path:
+                        del self._keys[cache_key]
+
+
+# Stack of active keys caches, per thread (and per asyncio task)
+_active_keys_caches = contextvars.ContextVar("active_keys_caches", default=())
+
+
+@contextmanager
+def caching_keys(cache=None):
+    """Cache the keys of all collections within a `with` block.
+
+    The cache is active in the current thread only, so that concurrent blocks
+    in other threads do not interfere.
+
+    Args:
+        cache (KeysCache): The cache to use. If None, the cache already active
+          is used, or a new cache without expiry if none is active.
+
+    Yields:
+        KeysCache: The active cache.
+    """
+    active_caches = _active_keys_caches.get()
+    if cache is None:
+        cache = active_caches[-1] if active_caches else KeysCache()
+    token = _active_keys_caches.set(active_caches + (cache,))
+    try:
+        yield cache
+    finally:
+        _active_keys_caches.reset(token)
+
+
+def _cache_keys_method(keys):
+    """Wrap a keys method, so that it uses the active keys cache.
+    """
+    if getattr(keys, "_uses_keys_cache", False):
+        return keys
+
+    @functools.wraps(keys)
+    def cached_keys(self):
+        active_caches = _active_keys_caches.get()
+        if not active_caches:
+            return keys(self)
+        return active_caches[-1].get(self, lambda: keys(self))
+
+    cached_keys._uses_keys_cache = True
+    return cached_keys
+
+
 def _get_instance(get_class, key, context):
     return get_class(key)(context)
 
@@ -81,6 +201,9 @@ class AbstractCollection(metaclass=MetaCollection):
     - a `keys` method, with a single argument `self`, returning a list of the
       collection keys.
     - an `Item` nested class, inheriting from a dataset class.
+
+    They can also set `item_cache_size`, the maximum number of item classes
+    kept in cache by `get` (None for no limit).
     """
 
     def keys(self):
@@ -89,6 +212,8 @@ class AbstractCollection(metaclass=MetaCollection):
     class Item:
         pass
 
+    item_cache_size = None
+
     def __init__(self, context):
         """Set the collection context.
 
@@ -134,7 +259,8 @@ class AbstractCollection(metaclass=MetaCollection):
         """Get one or several datasets from the collection.
 
         Dataset classes created from a collection have their key saved as the
-        `key` attribute.
+        `key` attribute. They are cached, so that requesting the same key
+        several times returns the same class.
 
         Args:
             key (str or list of str): The key(s) for which the dataset classes
@@ -148,15 +274,30 @@ class AbstractCollection(metaclass=MetaCollection):
         if isinstance(key, list) or isinstance(key, set):
             return {k: cls.get(k) for k in key}
 
+        with cls._item_classes_lock:
+            if key in cls._item_classes:
+                cls._item_classes.move_to_end(key)
+                return cls._item_classes[key]
+
         attributes = cls._set_item_attributes(cls, key)
         base_name = cls.name().split(":")[0]
         item_cls = type(f"{base_name}:{key}", (cls.Item,), attributes)
+
+        with cls._item_classes_lock:
+            # Another thread may have created the class in the meantime
+            item_cls = cls._item_classes.setdefault(key, item_cls)
+            if cls.item_cache_size is not None:
+                while len(cls._item_classes) > cls.item_cache_size:
+                    cls._item_classes.popitem(last=False)
         return item_cls
 
     @staticmethod
     def _set_item_attributes(cls, key):
         """Set class attributes to create a dataset class from the Item class.
         """
+        # Item classes of filtered collections are shared with the original
+        # collection, through which they are found when unpickling.
+        owner = getattr(cls, "_unfiltered_collection", cls)
         parents = [
             parent.filter_by(key) if is_collection_filter(parent) else parent
             for parent in cls.Item.parents
@@ -169,11 +310,12 @@ class AbstractCollection(metaclass=MetaCollection):
             # not inherited (as set in dataset metaclass)
             "parents": parents,
             "create": cls.Item.create,
+            "create_chunks": cls.Item.create_chunks,
             # enable pickling instances of this dynamically created class,
             # by providing the following __reduce__ function
             "__reduce__": lambda self: (
                 _get_instance,
-                (cls.get, self.key, self.context),
+                (owner.get, self.key, self.context),
             ),
         }
         return attributes
@@ -231,7 +373,9 @@ class MetaFileCollection(MetaCollection):
         return cls
 
 
-class FileCollection(AbstractCollection, metaclass=MetaFileCollection):
+class FileCollection(
+    PooledFileSystemMixin, AbstractCollection, metaclass=MetaFileCollection
+):
     """Collection of which items are FileDatasets.
 
     Inheriting classes must have the same attributes `keys` and `Item` as
@@ -257,7 +401,7 @@ class FileCollection(AbstractCollection, metaclass=MetaFileCollection):
         """
         uri = context["catalog_uri"]
         kwargs = context.get("fs_kwargs", {})
-        self.file_system = create_filesystem_from_uri(uri, **kwargs)
+        self.file_system = get_filesystem_from_uri(uri, **kwargs)
         super().__init__(context)
 
     @staticmethod
@@ -274,21 +418,190 @@ class FileCollection(AbstractCollection, metaclass=MetaFileCollection):
         )
         return attributes
 
-    def read(self, keys=None):
+    def read(
+        self, keys=None, max_workers=None, max_inflight_bytes=None, **kwargs
+    ):
         """Read a collection or a subset of it.
 
+        Items are read concurrently by a pool of threads.
+
         Args:
             keys (list of str): Keys to read. If None, all keys are read.
+            max_workers (int): Maximum number of items read concurrently. If
+              None, the value is taken from the context key
+              `read_max_workers`, and defaults to 1.
+            max_inflight_bytes (int): Maximum total size of the files being
+              read concurrently. A file larger than this limit is read alone.
+              If None, the value is taken from the context key
+              `read_max_inflight_bytes`, and defaults to no limit.
+            kwargs: Keyword arguments passed on to the `read` method of each
+              item (e.g. `columns` and `filters` for Parquet items).
 
         Returns:
-            dict: The data from requested collection items, indexed by key.
+            dict: The data from requested collection items, indexed by key,
+              in the order of keys.
+
+        Raises:
+            CollectionReadError: If any item could not be read.
         """
         if keys is None:
             keys = self.keys()
-
-        all_dfs = {key: self.get(key)(self.context).read() for key in keys}
+        if max_workers is None:
+            max_workers = self.context.get("read_max_workers", 1)
+        if max_inflight_bytes is None:
+            max_inflight_bytes = self.context.get("read_max_inflight_bytes")
+
+        keys = list(keys)
+        sizes = self._item_sizes(keys) if max_inflight_bytes else {}
+        budget = _ByteBudget(max_inflight_bytes)
+
+        def read_item(key):
+            try:
+                return self._read_item(key, **kwargs)
+            finally:
+                budget.release(sizes.get(key, 0))
+
+        futures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key in keys:
+                budget.acquire(sizes.get(key, 0))
+                futures[key] = executor.submit(read_item, key)
+
+        all_dfs = {}
+        errors = {}
+        for key, future in futures.items():
+            try:
+                all_dfs[key] = future.result()
+            except Exception as error:
+                errors[key] = error
+
+        if errors:
+            raise CollectionReadError(errors)
         return all_dfs
 
+    def iter_read(self, keys=None, prefetch=None, **kwargs):
+        """Iterate over a collection or a subset of it, reading items lazily.
+
+        While an item is processed by the caller, the next items are read in
+        background threads. At most `prefetch + 1` items are held by the
+        iterator at once.
+
+        Args:
+            keys (list of str): Keys to read. If None, all keys are read.
+            prefetch (int): Number of items read in advance. If None, the value
+              is taken from the context key `read_prefetch`, and defaults to 1.
+            kwargs: Keyword arguments passed on to the `read` method of each
+              item.
+
+        Yields:
+            tuple: The key and the data of each item, in the order of keys.
+        """
+        if keys is None:
+            keys = self.keys()
+        if prefetch is None:
+            prefetch = self.context.get("read_prefetch", 1)
+
+        if prefetch < 1:
+            for key in keys:
+                yield key, self._read_item(key, **kwargs)
+            return
+
+        keys = iter(keys)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+
+            def submit_next_read():
+                key = next(keys, _no_key)
+                if key is not _no_key:
+                    future = executor.submit(self._read_item, key, **kwargs)
+                    pending.append((key, future))
+
+            try:
+                for _ in range(prefetch):
+                    submit_next_read()
+
+                while pending:
+                    key, future = pending.popleft()
+                    submit_next_read()
+                    yield key, future.result()
+            finally:
+                # Do not wait for reads that are not needed anymore
+                for _, future in pending:
+                    future.cancel()
+
+    def _read_item(self, key, **kwargs):
+        """Read a single item of the collection.
+        """
+        return self.get(key)(self.context).read(**kwargs)
+
+    def _item_sizes(self, keys):
+        """Return the file sizes of collection items, listing files once.
+
+        Items without file are omitted.
+        """
+        details = self.file_system.listdir_details(self.relative_path)
+        sizes = {}
+        for key in keys:
+            filename = PurePath(self.get(key).relative_path).name
+            if filename in details:
+                sizes[key] = details[filename]["size"]
+        return sizes
+
+
+_no_key = object()
+
+
+class CollectionReadError(Exception):
+    """Error raised when items of a collection could not be read.
+
+    Attributes:
+        errors (dict): The exception raised for each item, indexed by key.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        msg = "Could not read collection items: {}.".format(
+            ", ".join(f"{key} ({error!r})" for key, error in errors.items())
+        )
+        super().__init__(msg)
+
+
+class _ByteBudget:
+    """Limit the total size of data being processed concurrently.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.bytes_in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, num_bytes):
+        """Wait until `num_bytes` fit in the budget, and reserve them.
+
+        Reservations always succeed when nothing else is reserved, so that
+        items larger than the budget can still be processed.
+        """
+        if self.max_bytes is None:
+            return
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.bytes_in_use == 0
+                or self.bytes_in_use + num_bytes <= self.max_bytes
+            )
+            self.bytes_in_use += num_bytes
+
+    def release(self, num_bytes):
+        """Release a reservation of `num_bytes`.
+        """
+        if self.max_bytes is None:
+            return
+        with self._condition:
+            self.bytes_in_use -= num_bytes
+            self._condition.notify_all()
+
+
+_filtered_collections_lock = threading.Lock()
+
 
 class CollectionFilter(ABCCollectionFilter):
     """A filter to create a collection as subset from another collection.
@@ -312,22 +625,32 @@ class CollectionFilter(ABCCollectionFilter):
     def filter_by(self, child_key):
         """Create a subset of a collection.
 
-        The subset changes as a function of the `child_key` value.
+        The subset changes as a function of the `child_key` value. Filtered
+        collections are cached: the same collection, key filter, and child key
+        always give the same class, with a name that does not change between
+        calls.
 
         Args:
             child_key (str): key used to define the subset.
         """
+        cache_key = (self.key_filter, child_key)
+        with _filtered_collections_lock:
+            if cache_key in self.collection._filtered_collections:
+                return self.collection._filtered_collections[cache_key]
 
         # Define the .keys() method for the filtered collection
+        key_filter = self.key_filter
+
         def keys(collection_self):
-            return self.key_filter(collection_self, child_key)
+            return key_filter(collection_self, child_key)
 
         # Create the class for the filtered collection
         # The filtered collection inherits the original collection. Some
         # attributes must be nonetheless specified explicitely, to follow
-        # the logic of the metaclass.
+        # the logic of the metaclass. Items are the same as in the original
+        # collection, so the cache of item classes is shared.
         filtered_collection = type(
-            self.collection.__name__ + ":filter" + uuid.uuid4().hex,
+            self.collection.__name__ + ":filter" + self._suffix(child_key),
             (self.collection,),
             {
                 "_catalog_module": self.collection._catalog_module,
@@ -335,9 +658,90 @@ class CollectionFilter(ABCCollectionFilter):
                 "keys": keys,
                 "__doc__": self.collection.__doc__,
                 "relative_path": self.collection.relative_path,
+                "_item_classes": self.collection._item_classes,
+                "_item_classes_lock": self.collection._item_classes_lock,
+                "_unfiltered_collection": getattr(
+                    self.collection, "_unfiltered_collection", self.collection
+                ),
             },
         )
-        return filtered_collection
+
+        with _filtered_collections_lock:
+            return self.collection._filtered_collections.setdefault(
+                cache_key, filtered_collection
+            )
+
+    def _suffix(self, child_key):
+        """Name suffix identifying the key filter and child key.
+
+        The suffix is derived from where the key filter is defined, from its
+        bytecode, and from the values it captures (closure and default
+        arguments), so that it is stable across calls and processes. When
+        captured values cannot be described deterministically, the suffix
+        identifies the key filter object instead, and is not shared with other
+        key filters.
+        """
+        key_filter = self.key_filter
+        code = getattr(key_filter, "__code__", None)
+        filter_id = "{}.{}:{}".format(
+            getattr(key_filter, "__module__", ""),
+            getattr(key_filter, "__qualname__", repr(key_filter)),
+            code.co_firstlineno if code else "",
+        )
+        try:
+            if code is not None:
+                filter_id += "|" + _stable_repr(code)
+            captured = [
+                getattr(key_filter, "__defaults__", None),
+                getattr(key_filter, "__kwdefaults__", None),
+                [
+                    cell.cell_contents
+                    for cell in getattr(key_filter, "__closure__", None) or ()
+                ],
+            ]
+            filter_id += "|" + _stable_repr(captured)
+        except ValueError:
+            filter_id += f"|id={id(key_filter)}"
+        digest = hashlib.sha1(f"{filter_id}|{child_key!r}".encode())
+        return digest.hexdigest()[:16]
+
+
+def _stable_repr(value):
+    """Return a repr of a value that is the same across processes.
+
+    Raises:
+        ValueError: If the value has no such repr, e.g. objects whose repr
+          includes their memory address.
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return repr(value)
+    elif inspect.isclass(value) and (is_dataset(value) or is_collection(value)):
+        return f"<{value.catalog_path()}>"
+    elif inspect.isfunction(value) and "<" not in value.__qualname__:
+        # Functions defined at module level are found by name
+        return f"<{value.__module__}.{value.__qualname__}>"
+    elif inspect.iscode(value):
+        # Nested functions appear as code objects among the constants
+        return "code({}, {}, {})".format(
+            value.co_code.hex(),
+            _stable_repr(value.co_consts),
+            _stable_repr(value.co_names),
+        )
+    elif isinstance(value, (list, tuple)):
+        items = ", ".join(_stable_repr(v) for v in value)
+        return f"{type(value).__name__}({items})"
+    elif isinstance(value, (set, frozenset)):
+        items = ", ".join(sorted(_stable_repr(v) for v in value))
+        return f"{type(value).__name__}({items})"
+    elif isinstance(value, dict):
+        items = ", ".join(
+            sorted(
+                f"{_stable_repr(k)}: {_stable_repr(v)}"
+                for k, v in value.items()
+            )
+        )
+        return f"dict({items})"
+    raise ValueError(f"No stable repr for {type(value).__name__} values.")
 
 
 class SingleDatasetFilter(ABCCollectionFilter):
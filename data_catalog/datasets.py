@@ -2,8 +2,10 @@
 
 """
 import inspect
+import itertools
 from pathlib import PurePath
 import pickle
+import struct
 
 import pandas as pd
 
@@ -16,12 +18,18 @@ from .abc import (
 )
 from .file_systems import (
     LocalFileSystem,
+    PooledFileSystemMixin,
     S3FileSystem,
-    create_filesystem_from_uri,
+    get_filesystem_from_uri,
 )
+from .caches import read_cache, reader_copy
 from .utils import _find_mandatory_arguments
 
 
+# Number of rows per chunk in chunked reads, unless set otherwise
+DEFAULT_CHUNKSIZE = 100000
+
+
 class MetaDataset(ABCMetaDataset):
     """Metaclass for dataset classes.
 
@@ -35,10 +43,22 @@ class MetaDataset(ABCMetaDataset):
             attrs["parents"] = []
         if "create" not in attrs:
             attrs["create"] = None
+        if "create_chunks" not in attrs:
+            attrs["create_chunks"] = None
+
+        if attrs["create"] is not None and attrs["create_chunks"] is not None:
+            raise ValueError(
+                "A dataset cannot define both `create` and `create_chunks`."
+            )
+        if attrs.get("ephemeral") and attrs["create_chunks"] is not None:
+            raise ValueError(
+                "Ephemeral datasets cannot define `create_chunks`."
+            )
 
         # Check compatibility of "parents" and "create"
-        if attrs["create"] is not None:
-            create_args = _find_mandatory_arguments(attrs["create"])
+        create = attrs["create"] or attrs["create_chunks"]
+        if create is not None:
+            create_args = _find_mandatory_arguments(create)
             # -1 to deduct `self`
             num_create_args = len(create_args) - 1
         else:
@@ -46,6 +66,12 @@ class MetaDataset(ABCMetaDataset):
 
         num_parents = len(attrs["parents"])
 
+        if attrs.get("parent_columns") is not None:
+            if len(attrs["parent_columns"]) != num_parents:
+                raise ValueError(
+                    "`parent_columns` must have the same length as `parents`."
+                )
+
         if num_create_args != num_parents:
             raise ValueError(
                 "The `create` function is incompatible with `parents`."
@@ -100,8 +126,21 @@ class AbstractDataset(metaclass=MetaDataset):
       `self`, the data loaded from all classes in `parents`. The number of input
       arguments (not counting `self`) must therefore be equal to the length of
       `parents`. The method must return the created data.
+    - `create_chunks`: A generator method to create the dataset chunk by chunk,
+      instead of `create`. It takes as inputs, aside from `self`, an iterator
+      of DataFrame chunks for each class in `parents`, and yields the chunks of
+      the created data. For collections, each item is a chunk.
+    - `in_memory_transfer`: With in-memory data transfers in task graphs,
+      whether the created data is passed on in memory (True) or through
+      storage (False). If None, the task graph decides from the data size.
+    - `ephemeral`: If True, the dataset is never written. Task graphs create
+      it in memory when one of its children must be updated, and pass it on
+      in memory.
     """
 
+    in_memory_transfer = None
+    ephemeral = False
+
     def __init__(self, context):
         """Sets the dataset context.
 
@@ -185,7 +224,9 @@ class MetaFileDataset(MetaDataset):
         return cls
 
 
-class FileDataset(AbstractDataset, metaclass=MetaFileDataset):
+class FileDataset(
+    PooledFileSystemMixin, AbstractDataset, metaclass=MetaFileDataset
+):
     """Base class for file datasets.
 
     Inheriting classes can have the same attributes `parents` and `create` as
@@ -198,12 +239,25 @@ class FileDataset(AbstractDataset, metaclass=MetaFileDataset):
       binary file.
     - `read_kwargs`: A dict of keyword arguments for reading the dataset.
     - `write_kwargs`: A dict of keyword arguments for writing the dataset.
+    - `parent_columns`: A list with, for each parent, the list of columns that
+      `create` needs, or None if all columns are needed. Columns are selected
+      when reading parents that support it.
+
+    Classes for file formats able to read a subset of columns set
+    `columns_read_kwarg` to the name of the corresponding read keyword argument.
+    Classes for binary formats that read efficiently from memory maps set
+    `supports_memory_map` to True. Classes able to read files chunk by chunk
+    (see `read_chunks`) set `supports_chunked_reads` to True.
     """
 
     file_extension = "dat"
     is_binary_file = True
     read_kwargs = {}
     write_kwargs = {}
+    parent_columns = None
+    columns_read_kwarg = None
+    supports_memory_map = False
+    supports_chunked_reads = False
 
     def __init__(self, context):
         """Sets the dataset context.
@@ -218,45 +272,151 @@ class FileDataset(AbstractDataset, metaclass=MetaFileDataset):
         """
         uri = context["catalog_uri"]
         kwargs = context.get("fs_kwargs", {})
-        self.file_system = create_filesystem_from_uri(uri, **kwargs)
+        self.file_system = get_filesystem_from_uri(uri, **kwargs)
         super().__init__(context)
 
-    def read(self):
+    def read(self, **kwargs):
         """Read the dataset on disk.
 
+        If the context key `read_cache_bytes` is set, data is kept in a cache
+        shared by all datasets of the process, bounded by this number of
+        bytes. Later reads of the same unchanged file return a copy of the
+        cached data (see caches.reader_copy), which readers can modify freely.
+        Reads with keyword arguments are not cached.
+
+        Args:
+            kwargs: Keyword arguments for reading, overriding `read_kwargs`
+              (e.g. `columns` and `filters` for Parquet datasets).
+
         Returns:
             pandas.DataFrame
         """
-        open_kwargs = {}
-        if (not self.is_binary_file) & ("encoding" in self.read_kwargs):
-            open_kwargs["encoding"] = self.read_kwargs["encoding"]
+        cache_bytes = self.context.get("read_cache_bytes")
+        if kwargs or not cache_bytes:
+            return self._read_from_storage(**kwargs)
+
+        if read_cache.max_bytes != cache_bytes:
+            read_cache.resize(cache_bytes)
+        path = self.file_system.uri(self.relative_path)
+        version = self.last_update_time()
+        found, data = read_cache.get(path, version)
+        if not found:
+            data = self._read_from_storage()
+            read_cache.put(path, version, data)
+        return reader_copy(data)
+
+    def _read_from_storage(self, **kwargs):
+        read_kwargs = {**self.read_kwargs, **kwargs}
+        with self._open_for_read(read_kwargs) as file:
+            return self._read(file, **read_kwargs)
+
+    def _open_for_read(self, read_kwargs):
+        """Open the dataset file for reading.
+
+        The file is memory-mapped when both the format and the file system
+        support it, unless the context key `read_memory_map` is False.
+        """
+        if (
+            self.supports_memory_map
+            and self.file_system.supports_memory_map
+            and self.context.get("read_memory_map", True)
+        ):
+            return self.file_system.open_memory_map(self.relative_path)
 
-        with self.file_system.open(
+        open_kwargs = {}
+        if (not self.is_binary_file) & ("encoding" in read_kwargs):
+            open_kwargs["encoding"] = read_kwargs["encoding"]
+        return self.file_system.open(
             self.relative_path, self.read_mode(), **open_kwargs
-        ) as file:
-            return self._read(file, **self.read_kwargs)
+        )
+
+    def read_chunks(self, chunksize=None, **kwargs):
+        """Read the dataset on disk, chunk by chunk.
+
+        The file is read progressively, so that datasets larger than memory
+        can be processed.
+
+        Args:
+            chunksize (int): Number of rows per chunk. If None, the value is
+              taken from the context key `read_chunksize`, and defaults to
+              DEFAULT_CHUNKSIZE.
+            kwargs: Keyword arguments for reading, overriding `read_kwargs`.
+
+        Yields:
+            pandas.DataFrame: The successive chunks of the dataset.
+        """
+        if chunksize is None:
+            chunksize = self.context.get("read_chunksize", DEFAULT_CHUNKSIZE)
+        read_kwargs = {**self.read_kwargs, **kwargs}
+        with self._open_for_read(read_kwargs) as file:
+            yield from self._read_chunks(file, chunksize, **read_kwargs)
 
     def write(self, df):
         """Write the dataset to disk.
 
+        The file is replaced atomically: a failed write leaves the previous
+        version of the dataset, if any, untouched.
+
         Args:
             df (pandas.DataFrame): dataset, to write on disk.
         """
+        read_cache.invalidate(self.file_system.uri(self.relative_path))
+
         open_kwargs = {}
         if (not self.is_binary_file) & ("encoding" in self.write_kwargs):
             open_kwargs["encoding"] = self.write_kwargs["encoding"]
 
-        with self.file_system.open(
+        with self.file_system.open_atomic(
             self.relative_path, self.write_mode(), **open_kwargs
         ) as file:
             return self._write(df, file, **self.write_kwargs)
 
+    def write_chunks(self, chunks):
+        """Write the dataset to disk, chunk by chunk.
+
+        Chunks are written as they come, without being held in memory together.
+        As with `write`, the file is replaced atomically.
+
+        Args:
+            chunks (iterable of pandas.DataFrame): The chunks of the dataset.
+
+        Raises:
+            ValueError: If there are no chunks. No file is written: a file
+              without data or schema could not be read back.
+        """
+        chunks = iter(chunks)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            raise ValueError(f"No chunks to write for {self.name()}.")
+        chunks = itertools.chain([first_chunk], chunks)
+
+        read_cache.invalidate(self.file_system.uri(self.relative_path))
+
+        open_kwargs = {}
+        if (not self.is_binary_file) & ("encoding" in self.write_kwargs):
+            open_kwargs["encoding"] = self.write_kwargs["encoding"]
+
+        with self.file_system.open_atomic(
+            self.relative_path, self.write_mode(), **open_kwargs
+        ) as file:
+            return self._write_chunks(chunks, file, **self.write_kwargs)
+
     def _read(self, file, **kwargs):
         raise NotImplementedError("Abstract file dataset.")
 
     def _write(self, df, file, **kwargs):
         raise NotImplementedError("Abstract file dataset.")
 
+    def _read_chunks(self, file, chunksize, **kwargs):
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support chunked reads."
+        )
+
+    def _write_chunks(self, chunks, file, **kwargs):
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support chunked writes."
+        )
+
     def path(self):
         """Full path on disk of this dataset.
         """
@@ -275,6 +435,14 @@ class FileDataset(AbstractDataset, metaclass=MetaFileDataset):
         """
         return self.file_system.exists(self.relative_path)
 
+    def fingerprint(self):
+        """Return a fingerprint of the dataset contents on disk.
+
+        Returns:
+            str: A string that changes whenever the contents change.
+        """
+        return self.file_system.fingerprint(self.relative_path)
+
     @classmethod
     def read_mode(cls):
         """Read mode of the dataset, can be binary or text.
@@ -288,12 +456,27 @@ class FileDataset(AbstractDataset, metaclass=MetaFileDataset):
         return "wb" if cls.is_binary_file else "w"
 
 
+def _check_no_chunked_read_kwargs(dataset, kwargs):
+    """Raise an error if chunked reads are given arguments they do not support.
+
+    Raises:
+        ValueError: If kwargs is not empty.
+    """
+    if kwargs:
+        raise ValueError(
+            "{} does not support {} in chunked reads.".format(
+                type(dataset).__name__, ", ".join(sorted(kwargs))
+            )
+        )
+
+
 class CsvDataset(FileDataset):
     """A CSV dataset saved as a file on a disk.
     """
 
     file_extension = "csv"
     is_binary_file = False
+    supports_chunked_reads = True
 
     def _read(self, file, **kwargs):
         return pd.read_csv(file, **kwargs)
@@ -301,6 +484,17 @@ class CsvDataset(FileDataset):
     def _write(self, df, file, **kwargs):
         df.to_csv(file, **kwargs)
 
+    def _read_chunks(self, file, chunksize, **kwargs):
+        with pd.read_csv(file, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+
+    def _write_chunks(self, chunks, file, **kwargs):
+        # The header is only written with the first chunk
+        for i, chunk in enumerate(chunks):
+            if i == 1:
+                kwargs = {**kwargs, "header": False}
+            chunk.to_csv(file, **kwargs)
+
 
 class ParquetDataset(FileDataset):
     """A Parquet dataset saved as a file on a disk.
@@ -308,6 +502,9 @@ class ParquetDataset(FileDataset):
 
     file_extension = "parquet"
     is_binary_file = True
+    columns_read_kwarg = "columns"
+    supports_memory_map = True
+    supports_chunked_reads = True
 
     def _read(self, file, **kwargs):
         return pd.read_parquet(file, **kwargs)
@@ -315,19 +512,231 @@ class ParquetDataset(FileDataset):
     def _write(self, df, file, **kwargs):
         df.to_parquet(file, **kwargs)
 
+    def _read_chunks(
+        self, file, chunksize, columns=None, filters=None, engine=None, **kwargs
+    ):
+        # Record batches are read with pyarrow, the default Parquet engine of
+        # pandas. Row filters are applied to each batch, before selecting
+        # columns, since they may apply to other columns.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if engine not in {None, "auto", "pyarrow"}:
+            kwargs["engine"] = engine
+        _check_no_chunked_read_kwargs(self, kwargs)
+
+        parquet_file = pq.ParquetFile(file)
+        if filters is None:
+            for batch in parquet_file.iter_batches(
+                batch_size=chunksize, columns=columns
+            ):
+                yield batch.to_pandas()
+            return
+
+        expression = pq.filters_to_expression(filters)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            table = pa.Table.from_batches([batch]).filter(expression)
+            if columns is not None:
+                table = table.select(columns)
+            if table.num_rows:
+                yield table.to_pandas()
+
+    def _write_chunks(self, chunks, file, index=None, **kwargs):
+        # Each chunk is appended as a row group. The schema is set by the first
+        # chunk.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        kwargs.pop("engine", None)
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=index)
+                    writer = pq.ParquetWriter(file, table.schema, **kwargs)
+                else:
+                    table = pa.Table.from_pandas(
+                        chunk, schema=writer.schema, preserve_index=index
+                    )
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+class FeatherDataset(FileDataset):
+    """A Feather (Arrow IPC) dataset saved as a file on a disk.
+
+    Feather files are fast to read and write, which suits intermediate
+    datasets. Files are uncompressed by default, so that reads from memory
+    maps need no decoding. Set the `compression` write argument to "lz4" or
+    "zstd" to compress them.
+    """
+
+    file_extension = "feather"
+    is_binary_file = True
+    write_kwargs = {"compression": "uncompressed"}
+    columns_read_kwarg = "columns"
+    supports_memory_map = True
+    supports_chunked_reads = True
+
+    def _read(self, file, **kwargs):
+        # The pyarrow import is done here, to make the dependency optional
+        import pyarrow.feather as feather
+
+        return feather.read_table(file, **kwargs).to_pandas()
+
+    def _write(self, df, file, **kwargs):
+        import pyarrow.feather as feather
+
+        feather.write_feather(df, file, **kwargs)
+
+    def _read_chunks(
+        self, file, chunksize, columns=None, memory_map=None, **kwargs
+    ):
+        # Record batches are read one at a time, and regrouped into chunks of
+        # chunksize rows. The file is already open: memory_map does not apply.
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        _check_no_chunked_read_kwargs(self, kwargs)
+        reader = ipc.open_file(file)
+        pending = []
+        num_pending_rows = 0
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            pending.append(batch)
+            num_pending_rows += batch.num_rows
+            while num_pending_rows >= chunksize:
+                table = pa.Table.from_batches(pending)
+                yield table.slice(0, chunksize).to_pandas()
+                rest = table.slice(chunksize)
+                pending = rest.to_batches()
+                num_pending_rows = rest.num_rows
+        if num_pending_rows:
+            yield pa.Table.from_batches(pending).to_pandas()
+
+    def _write_chunks(self, chunks, file, compression=None, **kwargs):
+        # Each chunk is appended as a record batch. The schema is set by the
+        # first chunk.
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        if compression == "uncompressed":
+            compression = None
+        options = ipc.IpcWriteOptions(compression=compression)
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk)
+                    schema = table.schema
+                    writer = ipc.new_file(file, schema, options=options)
+                else:
+                    table = pa.Table.from_pandas(chunk, schema=schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+# Header of pickle files with out-of-band buffers, see PickleDataset
+_FRAMED_PICKLE_MAGIC = b"DCPICKLE5\n"
+# Alignment of buffers in framed pickle files, in bytes
+_FRAMED_PICKLE_ALIGNMENT = 64
+
+
+def _dump_framed_pickle(obj, file, **kwargs):
+    """Pickle an object with protocol 5, saving large buffers out-of-band.
+
+    The file starts with a header giving the size of the pickle payload and of
+    each buffer. The payload follows, then the buffers, each aligned on
+    _FRAMED_PICKLE_ALIGNMENT bytes. Buffers are written from memory, without
+    copy.
+    """
+    buffers = []
+    payload = pickle.dumps(
+        obj, protocol=5, buffer_callback=buffers.append, **kwargs
+    )
+    raw_buffers = [buffer.raw() for buffer in buffers]
+    header = _FRAMED_PICKLE_MAGIC + struct.pack(
+        f"<QQ{len(raw_buffers)}Q",
+        len(payload),
+        len(raw_buffers),
+        *(raw.nbytes for raw in raw_buffers),
+    )
+    file.write(header)
+    file.write(payload)
+    position = len(header) + len(payload)
+    for raw in raw_buffers:
+        padding = -position % _FRAMED_PICKLE_ALIGNMENT
+        file.write(b"\0" * padding)
+        file.write(raw)
+        position += padding + raw.nbytes
+
+
+def _load_framed_pickle(file, copy_buffers=True, **kwargs):
+    """Unpickle an object saved by _dump_framed_pickle.
+
+    Buffers are read directly into the memory of the unpickled arrays. If
+    copy_buffers is False and the file is a pyarrow memory map, arrays use the
+    mapped memory without copy; they are then read-only.
+    """
+    position = len(_FRAMED_PICKLE_MAGIC)
+    payload_size, num_buffers = struct.unpack("<QQ", file.read(16))
+    buffer_sizes = struct.unpack(
+        f"<{num_buffers}Q", file.read(8 * num_buffers)
+    )
+    payload = file.read(payload_size)
+    position += 16 + 8 * num_buffers + payload_size
+
+    buffers = []
+    for size in buffer_sizes:
+        padding = -position % _FRAMED_PICKLE_ALIGNMENT
+        file.read(padding)
+        if not copy_buffers and hasattr(file, "read_buffer"):
+            buffers.append(file.read_buffer(size))
+        else:
+            buffer = bytearray(size)
+            file.readinto(buffer)
+            buffers.append(buffer)
+        position += padding + size
+
+    return pickle.loads(payload, buffers=buffers, **kwargs)
+
 
 class PickleDataset(FileDataset):
     """A Pickle dataset saved as a file on a disk.
+
+    Data is pickled with protocol 5, and large buffers (e.g. NumPy arrays in
+    DataFrames) are saved out-of-band in the same file, after the pickle
+    payload. Reading them needs a single copy, or none with the `copy_buffers`
+    read argument set to False (arrays are then read-only, and backed by the
+    memory-mapped file on local file systems). Files saved with an older
+    protocol can still be read. Set the `protocol` write argument to a lower
+    value to write them.
     """
 
     file_extension = "pickle"
     is_binary_file = True
+    supports_memory_map = True
 
-    def _read(self, file, **kwargs):
+    def _read(self, file, copy_buffers=True, **kwargs):
+        magic = file.read(len(_FRAMED_PICKLE_MAGIC))
+        if magic == _FRAMED_PICKLE_MAGIC:
+            return _load_framed_pickle(file, copy_buffers, **kwargs)
+        file.seek(0)
         return pickle.load(file, **kwargs)
 
-    def _write(self, df, file, **kwargs):
-        pickle.dump(df, file, **kwargs)
+    def _write(self, df, file, protocol=None, **kwargs):
+        if protocol is None:
+            protocol = pickle.HIGHEST_PROTOCOL
+        if protocol >= 5:
+            _dump_framed_pickle(df, file, **kwargs)
+        else:
+            pickle.dump(df, file, protocol=protocol, **kwargs)
 
 
 class ExcelDataset(FileDataset):
@@ -1,26 +1,60 @@
 """Classes representing file systems.
 """
+import asyncio
+from contextlib import contextmanager
+import functools
 from pathlib import Path, PurePosixPath
 from datetime import datetime
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
 import urllib.parse as parse
+import uuid
 
 from pytz import utc
 import s3fs
 
 from .abc import ABCFileSystem
+from .utils import _freeze
+
+
+# Default number of concurrent requests in bulk metadata calls
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+@functools.lru_cache(maxsize=None)
+def _pyarrow_available():
+    """Tell whether pyarrow, an optional dependency, can be imported.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
 
 
 class AbstractFileSystem(ABCFileSystem):
 
+    # Whether files can be read through memory maps, see open_memory_map
+    supports_memory_map = False
+
     def exists(self, path):
         raise NotImplementedError('Abstract file system.')
 
     def open(self, path, mode='r', **kwargs):
         raise NotImplementedError('Abstract file system.')
 
+    def open_atomic(self, path, mode='w', **kwargs):
+        raise NotImplementedError('Abstract file system.')
+
     def mkdir(self, path):
         raise NotImplementedError('Abstract file system.')
 
+    def mkdirs(self, paths):
+        raise NotImplementedError('Abstract file system.')
+
     def last_update_time(self, path):
         raise NotImplementedError('Abstract file system.')
 
@@ -33,22 +67,156 @@ class AbstractFileSystem(ABCFileSystem):
     def listdir(self, path, with_hidden_files=False):
         raise NotImplementedError('Abstract file system.')
 
+    def listdir_details(self, path):
+        raise NotImplementedError('Abstract file system.')
+
+    def fingerprint(self, path):
+        raise NotImplementedError('Abstract file system.')
+
+    def info(self, path):
+        raise NotImplementedError('Abstract file system.')
+
+    def info_many(self, paths, max_concurrency=None):
+        raise NotImplementedError('Abstract file system.')
+
+    async def async_exists(self, path):
+        raise NotImplementedError('Abstract file system.')
+
+    async def async_info(self, path):
+        raise NotImplementedError('Abstract file system.')
+
+    async def async_open(self, path, mode='r', **kwargs):
+        raise NotImplementedError('Abstract file system.')
+
+    def open_memory_map(self, path):
+        raise NotImplementedError('Memory maps are not supported.')
+
+
+def _is_write_mode(mode):
+    return any(char in mode for char in "wax+")
+
 
 class LocalFileSystem(AbstractFileSystem):
+    @property
+    def supports_memory_map(self):
+        # Memory maps are opened with pyarrow, which may not be installed
+        return _pyarrow_available()
+
     def __init__(self, root):
         self.root = Path(root)
+        # Directories known to exist, so that they are not created again
+        self._known_directories = set()
+        self._known_directories_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, and known directories may not exist where
+        # the file system is unpickled.
+        state = self.__dict__.copy()
+        del state["_known_directories"]
+        del state["_known_directories_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._known_directories = set()
+        self._known_directories_lock = threading.Lock()
 
     def exists(self, path):
         return (self.root/path).exists()
 
     def open(self, path, mode='r', **kwargs):
-        virtual_path = Path(path)
-        if not self.exists(virtual_path.parent):
-            self.mkdir(virtual_path.parent)
-        return (self.root/virtual_path).open(mode=mode, **kwargs)
+        """Open a file.
+
+        In write modes, the parent directory is created if it is not known
+        to exist. Reads only open the file.
+        """
+        full_path = self.root/path
+        if not _is_write_mode(mode):
+            return full_path.open(mode=mode, **kwargs)
+        return self._in_directory(
+            Path(path).parent, lambda: full_path.open(mode=mode, **kwargs)
+        )
+
+    @contextmanager
+    def open_atomic(self, path, mode='w', **kwargs):
+        """Open a file for writing, replacing it only once fully written.
+
+        Data is written to a hidden temporary file in the same directory,
+        which is renamed to the target path on success, and deleted on error.
+        The target file is thus never left partially written.
+
+        Args:
+            path (str or PurePath): The file path, relative to the root.
+            mode (str): The write mode, "w" or "wb".
+            kwargs: Keyword arguments passed on to `open`.
+
+        Yields:
+            file object: The temporary file, open for writing.
+        """
+        target_path = self.root/path
+        temp_path = target_path.with_name(
+            f".{target_path.name}.{uuid.uuid4().hex}.tmp"
+        )
+        temp_file = self._in_directory(
+            Path(path).parent, lambda: temp_path.open(mode=mode, **kwargs)
+        )
+        try:
+            with temp_file as file:
+                yield file
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
 
     def mkdir(self, path):
-        return (self.root/path).mkdir(parents=True, exist_ok=True)
+        (self.root/path).mkdir(parents=True, exist_ok=True)
+        with self._known_directories_lock:
+            self._known_directories.add(Path(path))
+
+    def mkdirs(self, paths):
+        """Create directories at once, skipping the ones known to exist.
+
+        Args:
+            paths (iterable): Directory paths, relative to the root.
+        """
+        with self._known_directories_lock:
+            unknown_paths = {Path(path) for path in paths}.difference(
+                self._known_directories
+            )
+        # Create the deepest directories first: their parents get created
+        # along, and are then skipped.
+        created_paths = set()
+        for path in sorted(unknown_paths, key=lambda p: -len(p.parts)):
+            if path not in created_paths:
+                self.mkdir(path)
+                created_paths.update([path, *path.parents])
+        with self._known_directories_lock:
+            self._known_directories.update(created_paths)
+
+    def _in_directory(self, path, open_file):
+        """Open a file in a directory, creating the directory if needed.
+
+        The directory is created if it is not known to exist. If it was
+        removed since it was known, it is created again.
+
+        Args:
+            path (Path): The directory path, relative to the root.
+            open_file (callable): Function opening the file.
+        """
+        with self._known_directories_lock:
+            is_known = path in self._known_directories
+        if not is_known:
+            self.mkdir(path)
+        try:
+            return open_file()
+        except FileNotFoundError:
+            if not is_known:
+                raise
+            with self._known_directories_lock:
+                self._known_directories.discard(path)
+            self.mkdir(path)
+            return open_file()
 
     def last_update_time(self, path):
         if self.exists(path):
@@ -73,10 +241,157 @@ class LocalFileSystem(AbstractFileSystem):
                 filenames.append(filename)
         return filenames
 
+    def listdir_details(self, path):
+        """List files in a directory, with their metadata.
+
+        Hidden files are included. A missing directory has no files.
+
+        Returns:
+            dict: For each file name, a dict with keys `last_update_time` and
+              `size`.
+        """
+        details = {}
+        try:
+            entries = list(os.scandir(self.full_path(path)))
+        except (FileNotFoundError, NotADirectoryError):
+            return details
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                details[entry.name] = {
+                    "last_update_time": datetime.fromtimestamp(
+                        stat.st_mtime
+                    ).astimezone(),
+                    "size": stat.st_size,
+                }
+        return details
+
+    def fingerprint(self, path):
+        """Return a fingerprint of the file contents.
+
+        Returns:
+            str: The file size and a hash of its contents.
+        """
+        file_hash = hashlib.blake2b(digest_size=16)
+        with (self.root/path).open("rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                file_hash.update(chunk)
+        size = (self.root/path).stat().st_size
+        return f"{size}-{file_hash.hexdigest()}"
+
+    def info(self, path):
+        """Return the metadata of a file.
+
+        Returns:
+            dict: The file metadata, with keys `last_update_time` and `size`.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        stat = (self.root/path).stat()
+        return {
+            "last_update_time": datetime.fromtimestamp(
+                stat.st_mtime
+            ).astimezone(),
+            "size": stat.st_size,
+        }
+
+    def info_many(self, paths, max_concurrency=None):
+        """Return the metadata of many files.
+
+        Local metadata calls are fast, so they are made one after the other.
+
+        Args:
+            paths (iterable): File paths, relative to the root.
+            max_concurrency (int): Unused.
+
+        Returns:
+            dict: For each path, the file metadata (see `info`), or None if
+              the file does not exist.
+        """
+        infos = {}
+        for path in paths:
+            try:
+                infos[path] = self.info(path)
+            except FileNotFoundError:
+                infos[path] = None
+        return infos
+
+    async def async_exists(self, path):
+        """Tell whether a file exists. Local calls are made directly.
+        """
+        return self.exists(path)
+
+    async def async_info(self, path):
+        """Return the metadata of a file, see `info`.
+
+        Local calls are made directly.
+        """
+        return self.info(path)
+
+    async def async_open(self, path, mode='r', **kwargs):
+        """Open a file, see `open`. Local calls are made directly.
+        """
+        return self.open(path, mode, **kwargs)
+
+    def open_memory_map(self, path):
+        """Open a file for reading through a memory map.
+
+        Reads from the returned file do not copy data through Python buffers,
+        and pyarrow readers can use its memory without copying. The page cache
+        is shared by all processes mapping the same file.
+
+        Returns:
+            pyarrow.MemoryMappedFile: A read-only file object.
+        """
+        # The pyarrow import is done here, to make the dependency optional
+        import pyarrow
+
+        return pyarrow.memory_map(str(self.full_path(path)), "r")
+
+
+def _supports_upload_concurrency():
+    """Tell whether s3fs can set the number of parts uploaded concurrently.
+
+    The `max_concurrency` argument of `put_file` appeared in s3fs 2024.3.0.
+    """
+    put_file = s3fs.S3FileSystem._put_file
+    return "max_concurrency" in inspect.signature(put_file).parameters
+
 
 class S3FileSystem(AbstractFileSystem):
-    def __init__(self, root, **s3fs_kwargs):
+    def __init__(
+        self,
+        root,
+        upload_part_size=None,
+        upload_max_concurrency=None,
+        **s3fs_kwargs
+    ):
+        """Initialize the file system.
+
+        Args:
+            root (str): The bucket and prefix of the root.
+            upload_part_size (int): Size in bytes of the parts of multipart
+              uploads in atomic writes. If None, the s3fs default is used.
+            upload_max_concurrency (int): Number of parts uploaded
+              concurrently in atomic writes. If None, the s3fs default is used.
+              Requires s3fs 2024.3.0 or later.
+            s3fs_kwargs: Keyword arguments passed on to s3fs.S3FileSystem.
+
+        Raises:
+            ValueError: If upload_max_concurrency is set, and the installed
+              s3fs does not support it.
+        """
+        if (
+            upload_max_concurrency is not None
+            and not _supports_upload_concurrency()
+        ):
+            raise ValueError(
+                "upload_max_concurrency requires s3fs 2024.3.0 or later."
+            )
         self.root = PurePosixPath(root)
+        self.upload_part_size = upload_part_size
+        self.upload_max_concurrency = upload_max_concurrency
         self.file_system = s3fs.S3FileSystem(**s3fs_kwargs)
 
     def exists(self, path):
@@ -85,9 +400,46 @@ class S3FileSystem(AbstractFileSystem):
     def open(self, path, mode='r', **kwargs):
         return self.file_system.open(self.full_path(path), mode, **kwargs)
 
+    @contextmanager
+    def open_atomic(self, path, mode='w', **kwargs):
+        """Open a file for writing, creating the object only once fully written.
+
+        Data is written to a local temporary file, then uploaded. Large files
+        are uploaded in parts, concurrently, and the object appears only when
+        the multipart upload completes. Nothing is uploaded on error.
+
+        Args:
+            path (str or PurePath): The file path, relative to the root.
+            mode (str): The write mode, "w" or "wb".
+            kwargs: Keyword arguments passed on to `open`.
+
+        Yields:
+            file object: The temporary file, open for writing.
+        """
+        put_kwargs = {}
+        if self.upload_part_size is not None:
+            put_kwargs["chunksize"] = self.upload_part_size
+        if self.upload_max_concurrency is not None:
+            put_kwargs["max_concurrency"] = self.upload_max_concurrency
+
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            with open(temp_path, mode, **kwargs) as file:
+                yield file
+            self.file_system.put_file(
+                temp_path, self.full_path(path), **put_kwargs
+            )
+        finally:
+            os.remove(temp_path)
+
     def mkdir(self, path):
         return self.file_system.mkdir(self.full_path(path))
 
+    def mkdirs(self, paths):
+        """Do nothing: S3 has no directories, only key prefixes.
+        """
+
     def last_update_time(self, path):
         if self.exists(path):
             return self.file_system.info(self.full_path(path))['LastModified']
@@ -109,6 +461,133 @@ class S3FileSystem(AbstractFileSystem):
                 filenames.append(filename)
         return filenames
 
+    def listdir_details(self, path):
+        """List files under a prefix, with their metadata, in a single call.
+
+        Hidden files are included. A missing prefix has no files.
+
+        Returns:
+            dict: For each file name, a dict with keys `last_update_time` and
+              `size`.
+        """
+        prefix = self.full_path(path)
+        details = {}
+        try:
+            file_descs = self.file_system.ls(prefix, detail=True)
+        except FileNotFoundError:
+            return details
+        for file_desc in file_descs:
+            if file_desc.get("type") != "file":
+                continue
+            filename = str(PurePosixPath(file_desc["name"]).relative_to(prefix))
+            details[filename] = {
+                "last_update_time": file_desc["LastModified"],
+                "size": file_desc["size"],
+            }
+        return details
+
+    def fingerprint(self, path):
+        """Return a fingerprint of the file contents, without reading them.
+
+        Returns:
+            str: The file size and its ETag.
+        """
+        info = self.file_system.info(self.full_path(path))
+        etag = info["ETag"].strip('"')
+        return f"{info['size']}-{etag}"
+
+    def info(self, path):
+        """Return the metadata of a file.
+
+        Returns:
+            dict: The file metadata, with keys `last_update_time` and `size`.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        return _s3_file_details(self.file_system.info(self.full_path(path)))
+
+    def info_many(self, paths, max_concurrency=None):
+        """Return the metadata of many files, with concurrent requests.
+
+        Args:
+            paths (iterable): File paths, relative to the root.
+            max_concurrency (int): Maximum number of concurrent requests,
+              DEFAULT_MAX_CONCURRENCY if None.
+
+        Returns:
+            dict: For each path, the file metadata (see `info`), or None if
+              the file does not exist.
+        """
+        # The s3fs file system runs its coroutines in its own event loop
+        from fsspec.asyn import sync
+
+        paths = list(paths)
+        infos = sync(
+            self.file_system.loop, self._info_many, paths, max_concurrency
+        )
+        return dict(zip(paths, infos))
+
+    async def async_exists(self, path):
+        """Tell whether a file exists.
+        """
+        return await self._run_async(
+            self.file_system._exists(self.full_path(path))
+        )
+
+    async def async_info(self, path):
+        """Return the metadata of a file, see `info`.
+        """
+        info = await self._run_async(
+            self.file_system._info(self.full_path(path))
+        )
+        return _s3_file_details(info)
+
+    async def async_open(self, path, mode='r', **kwargs):
+        """Open a file, see `open`.
+
+        The file is opened in a thread. The returned file object is
+        synchronous.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.open, path, mode, **kwargs)
+        )
+
+    async def _info_many(self, paths, max_concurrency=None):
+        semaphore = asyncio.Semaphore(
+            max_concurrency or DEFAULT_MAX_CONCURRENCY
+        )
+
+        async def info_or_none(path):
+            async with semaphore:
+                try:
+                    info = await self.file_system._info(self.full_path(path))
+                    return _s3_file_details(info)
+                except FileNotFoundError:
+                    return None
+
+        return await asyncio.gather(*(info_or_none(path) for path in paths))
+
+    def _run_async(self, coroutine):
+        """Run a coroutine of the s3fs file system, from any event loop.
+
+        The s3fs file system is bound to its own event loop, running in a
+        separate thread, where coroutines are scheduled.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            coroutine, self.file_system.loop
+        )
+        return asyncio.wrap_future(future)
+
+
+def _s3_file_details(info):
+    """Convert file metadata from s3fs, see `S3FileSystem.info`.
+    """
+    if info.get("type") != "file":
+        raise FileNotFoundError(info.get("name"))
+    return {"last_update_time": info["LastModified"], "size": info["size"]}
+
 
 def create_filesystem_from_uri(uri, **kwargs):
     parsed_uri = parse.urlparse(uri)
@@ -119,3 +598,62 @@ def create_filesystem_from_uri(uri, **kwargs):
         return LocalFileSystem(parse.unquote(parsed_uri.path))
     else:
         raise ValueError(f"Unknown URI scheme {parsed_uri.scheme}.")
+
+
+_file_system_pool = {}
+_file_system_pool_lock = threading.Lock()
+
+
+def _reset_file_system_pool():
+    """Empty the pool, so that file systems get created anew.
+    """
+    global _file_system_pool_lock
+    _file_system_pool.clear()
+    _file_system_pool_lock = threading.Lock()
+
+
+# File systems hold sessions and connection pools that must not be shared
+# between processes: a forked process starts with an empty pool.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_file_system_pool)
+
+
+def get_filesystem_from_uri(uri, **kwargs):
+    """Return a file system shared by all callers with the same arguments.
+
+    File systems are created on first request by create_filesystem_from_uri,
+    then kept in a process-wide pool keyed by the URI and keyword arguments.
+
+    Args:
+        uri (str): URI of the file system root, starting with `file://` or
+          `s3://`.
+        kwargs: keyword arguments passed on to the file system object.
+
+    Returns:
+        AbstractFileSystem: The shared file system.
+    """
+    key = (uri, _freeze(kwargs))
+    with _file_system_pool_lock:
+        if key not in _file_system_pool:
+            _file_system_pool[key] = create_filesystem_from_uri(uri, **kwargs)
+        return _file_system_pool[key]
+
+
+class PooledFileSystemMixin:
+    """Mixin for objects using the pooled file system of their context.
+
+    The `file_system` attribute is not pickled: it is taken from the pool of
+    the process unpickling the object, see get_filesystem_from_uri, with the
+    `catalog_uri` and `fs_kwargs` keys of the object `context`.
+    """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("file_system", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        uri = self.context["catalog_uri"]
+        kwargs = self.context.get("fs_kwargs", {})
+        self.file_system = get_filesystem_from_uri(uri, **kwargs)
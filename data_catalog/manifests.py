@@ -0,0 +1,309 @@
+"""Manifests recording how datasets were created.
+
+Each file dataset created by a task graph can have a manifest, saved as a
+hidden sidecar file next to the dataset file. The manifest records the
+fingerprint of the dataset contents, the fingerprints of the inputs it was
+created from, and a hash of the code that created it.
+
+The catalog manifest gathers in a single file, at the catalog root, the
+storage state and manifests of datasets, so that they can be loaded at once.
+
+"""
+from datetime import datetime
+import hashlib
+import inspect
+import json
+from pathlib import PurePath
+import textwrap
+
+from .abc import is_collection
+from .datasets import FileDataset
+from .utils import _freeze
+
+
+def manifest_path(dataset):
+    """Return the path of the manifest of a dataset.
+
+    Args:
+        dataset (FileDataset): The dataset.
+
+    Returns:
+        PurePath: Path relative to the catalog URI, in the dataset folder.
+    """
+    relative_path = PurePath(dataset.relative_path)
+    return relative_path.parent / f".{relative_path.name}.manifest.json"
+
+
+def read_manifest(dataset):
+    """Read the manifest of a dataset.
+
+    Args:
+        dataset (AbstractDataset): The dataset.
+
+    Returns:
+        dict: The manifest, or None if the dataset has no manifest.
+    """
+    if not isinstance(dataset, FileDataset):
+        return None
+    path = manifest_path(dataset)
+    if not dataset.file_system.exists(path):
+        return None
+    with dataset.file_system.open(path, "r") as file:
+        return json.load(file)
+
+
+def write_manifest(dataset, parents, cache=None, with_fingerprints=True):
+    """Write the manifest of a dataset that has just been created.
+
+    Args:
+        dataset (FileDataset): The dataset.
+        parents (list): Instances of the datasets and collections that the
+            dataset was created from.
+        cache (dict): Fingerprints already computed, see `fingerprint`. Parents
+            are complete when the dataset is created, so the cache can be
+            shared by all the datasets created by a task graph.
+        with_fingerprints (bool): If False, the fingerprints of the dataset
+            and its inputs are not recorded, which spares reading their
+            contents. Only the code hash is then recorded.
+    """
+    if not isinstance(dataset, FileDataset) or dataset.ephemeral:
+        return
+    manifest = {"last_update_time": dataset.last_update_time().isoformat()}
+    if with_fingerprints:
+        manifest["fingerprint"] = dataset.fingerprint()
+        manifest["inputs"] = {
+            parent.catalog_path(): fingerprint(parent, cache=cache)
+            for parent in parents
+        }
+    manifest["code_hash"] = code_hash(dataset)
+    with dataset.file_system.open_atomic(manifest_path(dataset)) as file:
+        json.dump(manifest, file)
+
+
+def fingerprint(data_object, last_update_times=None, cache=None):
+    """Return the fingerprint of a dataset or collection.
+
+    The fingerprint saved in the dataset manifest is reused if the dataset has
+    not been modified since the manifest was written. Otherwise, it is computed
+    from the dataset contents. Ephemeral datasets, which are not stored, take
+    the fingerprints of their parents.
+
+    Args:
+        data_object (FileDataset or FileCollection): The dataset or collection.
+        last_update_times (dict): Last update times of datasets, if already
+            known.
+        cache (dict): Fingerprints already computed, indexed by dataset. It is
+            completed with the new fingerprints.
+
+    Returns:
+        str: The fingerprint, None if unavailable.
+    """
+    if cache is not None and data_object in cache:
+        return cache[data_object]
+
+    if is_collection(data_object):
+        context = data_object.context
+        item_fingerprints = sorted(
+            (
+                str(key),
+                fingerprint(
+                    data_object.get(key)(context), last_update_times, cache
+                ),
+            )
+            for key in data_object.keys()
+        )
+        digest = hashlib.sha1(json.dumps(item_fingerprints).encode())
+        result = digest.hexdigest()
+
+    elif getattr(data_object, "ephemeral", False):
+        context = data_object.context
+        parent_fingerprints = [
+            fingerprint(parent(context), last_update_times, cache)
+            for parent in data_object.parents
+        ]
+        digest = hashlib.sha1(json.dumps(parent_fingerprints).encode())
+        result = digest.hexdigest()
+
+    elif isinstance(data_object, FileDataset):
+        last_update_time = (last_update_times or {}).get(data_object)
+        if last_update_time is None:
+            last_update_time = data_object.last_update_time()
+        manifest = read_manifest(data_object)
+        if (
+            manifest is not None
+            and "fingerprint" in manifest
+            and manifest["last_update_time"] == last_update_time.isoformat()
+        ):
+            result = manifest["fingerprint"]
+        else:
+            result = data_object.fingerprint()
+
+    else:
+        result = None
+
+    if cache is not None:
+        cache[data_object] = result
+    return result
+
+
+def code_hash(dataset):
+    """Return a hash of the code defining a dataset.
+
+    The hash covers the source of the `create` (or `create_chunks`) method,
+    the parents, and the read and write keyword arguments. The code of
+    ephemeral parents, which have no manifest, is covered as well.
+
+    Args:
+        dataset (AbstractDataset): The dataset (class or instance).
+
+    Returns:
+        str: The hash.
+    """
+    create = dataset.create or getattr(dataset, "create_chunks", None)
+    if create is None:
+        source = ""
+    else:
+        try:
+            source = textwrap.dedent(inspect.getsource(create))
+        except (OSError, TypeError):
+            # The source is unavailable, e.g. for code defined dynamically
+            code = create.__code__
+            source = repr((code.co_code, code.co_consts, code.co_names))
+
+    code_description = (
+        source,
+        [parent.catalog_path() for parent in dataset.parents],
+        _freeze(getattr(dataset, "read_kwargs", {})),
+        _freeze(getattr(dataset, "write_kwargs", {})),
+    )
+    ephemeral_parent_hashes = [
+        code_hash(parent)
+        for parent in dataset.parents
+        if getattr(parent, "ephemeral", False)
+    ]
+    if ephemeral_parent_hashes:
+        code_description += (ephemeral_parent_hashes,)
+    code_description = repr(code_description)
+    return hashlib.sha1(code_description.encode()).hexdigest()
+
+
+def code_changed(manifest, dataset):
+    """Tell whether the code of a dataset changed since it was created.
+
+    Args:
+        manifest (dict): The dataset manifest, see `read_manifest`.
+        dataset (AbstractDataset): The dataset.
+
+    Returns:
+        bool: Whether the code changed, or None if the manifest is missing or
+          has no code hash.
+    """
+    if manifest is None or "code_hash" not in manifest:
+        return None
+    return manifest["code_hash"] != code_hash(dataset)
+
+
+def inputs_changed(manifest, parents, last_update_times=None, cache=None):
+    """Tell whether the inputs of a dataset changed since it was created.
+
+    Args:
+        manifest (dict): The dataset manifest, see `read_manifest`.
+        parents (list): Instances of the datasets and collections that the
+            dataset is created from.
+        last_update_times (dict): Last update times of datasets, if already
+            known.
+        cache (dict): Fingerprints already computed, see `fingerprint`.
+
+    Returns:
+        bool: Whether the inputs changed, or None if the manifest is missing or
+          has no input fingerprints.
+    """
+    if manifest is None or "inputs" not in manifest:
+        return None
+
+    current_inputs = {
+        parent.catalog_path(): fingerprint(parent, last_update_times, cache)
+        for parent in parents
+    }
+    return current_inputs != manifest["inputs"]
+
+
+class CatalogManifest:
+    """The storage state of catalog datasets, saved in a single file.
+
+    Entries are indexed by dataset catalog path. Each entry holds the last
+    update time and size of a dataset file, and possibly the dataset manifest.
+    """
+
+    path = PurePath(".data_catalog") / "manifest.json"
+
+    def __init__(self, file_system, entries=None):
+        """Initialize the catalog manifest.
+
+        Args:
+            file_system (AbstractFileSystem): The file system of the catalog.
+            entries (dict): The initial entries.
+        """
+        self.file_system = file_system
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, file_system):
+        """Load the catalog manifest from storage.
+
+        Args:
+            file_system (AbstractFileSystem): The file system of the catalog.
+
+        Returns:
+            CatalogManifest: The loaded manifest, empty if it does not exist.
+        """
+        if not file_system.exists(cls.path):
+            return cls(file_system)
+        with file_system.open(cls.path, "r") as file:
+            return cls(file_system, json.load(file))
+
+    def save(self):
+        """Save the catalog manifest to storage.
+        """
+        with self.file_system.open_atomic(self.path) as file:
+            json.dump(self.entries, file)
+
+    def __contains__(self, dataset):
+        return dataset.catalog_path() in self.entries
+
+    def last_update_time(self, dataset):
+        """Return the recorded last update time of a dataset.
+        """
+        entry = self.entries[dataset.catalog_path()]
+        return datetime.fromisoformat(entry["last_update_time"])
+
+    def size(self, dataset):
+        """Return the recorded file size of a dataset, None if unknown.
+        """
+        return self.entries[dataset.catalog_path()].get("size")
+
+    def manifest(self, dataset):
+        """Return the recorded manifest of a dataset, None if unknown.
+        """
+        return self.entries[dataset.catalog_path()].get("manifest")
+
+    def record(self, dataset, last_update_time, size=None, manifest=None):
+        """Record the storage state of a dataset.
+
+        Args:
+            dataset (AbstractDataset): The dataset.
+            last_update_time (datetime): Last update time of the dataset.
+            size (int): File size of the dataset, if known.
+            manifest (dict): Manifest of the dataset, if known.
+        """
+        entry = {"last_update_time": last_update_time.isoformat()}
+        if size is not None:
+            entry["size"] = size
+        if manifest is not None:
+            entry["manifest"] = manifest
+        self.entries[dataset.catalog_path()] = entry
+
+    def discard(self, dataset):
+        """Remove the entry of a dataset, if any.
+        """
+        self.entries.pop(dataset.catalog_path(), None)
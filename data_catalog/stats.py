@@ -0,0 +1,416 @@
+"""Task statistics and critical-path scheduling.
+
+The duration and output size of the tasks creating datasets are recorded in a
+stats store, a single file at the catalog root. From these durations, tasks
+are prioritized by the length of the critical path they start, i.e. the
+longest chain of task durations from the task to the end of the graph, so that
+the longest chains start first.
+
+"""
+import bisect
+import heapq
+import json
+import logging
+import os
+from pathlib import PurePath
+import time
+
+from dask.callbacks import Callback
+from dask.core import get_dependencies, toposort
+
+from .abc import is_dataset
+from .datasets import FileDataset
+from .file_systems import get_filesystem_from_uri
+from .taskgraph import ItemBatch, StoredData
+from .utils import estimate_size
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStats:
+    """Durations and output sizes of the tasks creating datasets.
+
+    Entries are indexed by dataset catalog path. Each entry holds the duration
+    of the last creation of a dataset, in seconds, and possibly its size in
+    memory and its file size, in bytes.
+    """
+
+    path = PurePath(".data_catalog") / "stats.json"
+
+    def __init__(self, file_system, entries=None):
+        """Initialize the stats store.
+
+        Args:
+            file_system (AbstractFileSystem): The file system of the catalog.
+            entries (dict): The initial entries.
+        """
+        self.file_system = file_system
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, file_system):
+        """Load the stats store from storage.
+
+        Args:
+            file_system (AbstractFileSystem): The file system of the catalog.
+
+        Returns:
+            TaskStats: The loaded stats, empty if they do not exist.
+        """
+        if not file_system.exists(cls.path):
+            return cls(file_system)
+        with file_system.open(cls.path, "r") as file:
+            return cls(file_system, json.load(file))
+
+    @classmethod
+    def from_context(cls, context):
+        """Load the stats store of the catalog of a context.
+
+        Args:
+            context (dict): The context, with the catalog URI and possibly file
+                system options.
+
+        Returns:
+            TaskStats: The loaded stats, empty if they do not exist.
+        """
+        file_system = get_filesystem_from_uri(
+            context["catalog_uri"], **context.get("fs_kwargs", {})
+        )
+        return cls.load(file_system)
+
+    def save(self):
+        """Save the stats store to storage.
+        """
+        with self.file_system.open_atomic(self.path) as file:
+            json.dump(self.entries, file)
+
+    def __contains__(self, dataset):
+        return dataset.catalog_path() in self.entries
+
+    def duration(self, dataset):
+        """Return the recorded duration of a dataset, None if unknown.
+        """
+        entry = self.entries.get(dataset.catalog_path(), {})
+        return entry.get("duration")
+
+    def memory_size(self, dataset):
+        """Return the recorded size in memory of a dataset, None if unknown.
+        """
+        entry = self.entries.get(dataset.catalog_path(), {})
+        return entry.get("memory_size")
+
+    def file_size(self, dataset):
+        """Return the recorded file size of a dataset, None if unknown.
+        """
+        entry = self.entries.get(dataset.catalog_path(), {})
+        return entry.get("file_size")
+
+    def record(self, dataset, duration, memory_size=None, file_size=None):
+        """Record the creation of a dataset.
+
+        Sizes that are not given are kept from the previous record, if any.
+
+        Args:
+            dataset (AbstractDataset): The dataset.
+            duration (float): Duration of the creation, in seconds.
+            memory_size (int): Size of the created data in memory, if known.
+            file_size (int): File size of the created dataset, if known.
+        """
+        entry = dict(self.entries.get(dataset.catalog_path(), {}))
+        entry["duration"] = duration
+        if memory_size is not None:
+            entry["memory_size"] = memory_size
+        if file_size is not None:
+            entry["file_size"] = file_size
+        self.entries[dataset.catalog_path()] = entry
+
+
+def _creates_dataset(key, task):
+    """Tell whether a task creates a dataset (as opposed to reading it).
+
+    Read tasks are (func,) or None, create tasks are (func, parents).
+    """
+    return is_dataset(key) and isinstance(task, tuple) and len(task) > 1
+
+
+def task_durations(task_graph, task_stats, default_duration=None):
+    """Estimate the duration of each task of a task graph.
+
+    Tasks creating datasets take their recorded duration. Tasks of batches of
+    items take the sum of the durations of their items. Read and collect tasks
+    are considered instantaneous.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        task_stats (TaskStats): Recorded task statistics.
+        default_duration (float): Duration of tasks creating datasets that have
+            no record. Defaults to the mean recorded duration of the datasets
+            in the graph, or to 1 second without records.
+
+    Returns:
+        dict: The estimated duration of each task, in seconds.
+    """
+    created = {}
+    for key, task in task_graph.items():
+        if isinstance(key, ItemBatch):
+            created[key] = list(key.items)
+        elif _creates_dataset(key, task):
+            created[key] = [key]
+
+    if default_duration is None:
+        known_durations = [
+            task_stats.duration(dataset)
+            for datasets in created.values()
+            for dataset in datasets
+            if task_stats.duration(dataset) is not None
+        ]
+        if known_durations:
+            default_duration = sum(known_durations) / len(known_durations)
+        else:
+            default_duration = 1.0
+
+    durations = {}
+    for key in task_graph:
+        durations[key] = 0.0
+        for dataset in created.get(key, []):
+            duration = task_stats.duration(dataset)
+            durations[key] += (
+                default_duration if duration is None else duration
+            )
+    return durations
+
+
+def critical_path_lengths(task_graph, durations):
+    """Return the length of the critical path starting at each task.
+
+    The critical path of a task is the longest chain of task durations from
+    the task (included) to the end of the graph.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        durations (dict): Duration of each task, see `task_durations`.
+
+    Returns:
+        dict: The critical path length of each task, in seconds.
+    """
+    dependents = {key: [] for key in task_graph}
+    for key in task_graph:
+        for dependency in get_dependencies(task_graph, key):
+            dependents[dependency].append(key)
+
+    lengths = {}
+    for key in reversed(toposort(task_graph)):
+        lengths[key] = durations.get(key, 0.0) + max(
+            (lengths[dependent] for dependent in dependents[key]), default=0.0
+        )
+    return lengths
+
+
+def simulate_makespan(task_graph, durations, priorities, num_workers):
+    """Predict the makespan of a task graph, by simulating its execution.
+
+    Ready tasks are started by decreasing priority, as soon as a worker is
+    available.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        durations (dict): Duration of each task, see `task_durations`.
+        priorities (dict): Priority of each task, higher first.
+        num_workers (int): Number of workers running tasks in parallel.
+
+    Returns:
+        float: The predicted makespan, in seconds.
+    """
+    waiting = {key: set() for key in task_graph}
+    dependents = {key: [] for key in task_graph}
+    for key in task_graph:
+        for dependency in get_dependencies(task_graph, key):
+            waiting[key].add(dependency)
+            dependents[dependency].append(key)
+
+    # Heaps of ready tasks, by priority, and of running tasks, by end time
+    order = {key: i for i, key in enumerate(task_graph)}
+    ready = [
+        (-priorities.get(key, 0.0), order[key], key)
+        for key, dependencies in waiting.items()
+        if not dependencies
+    ]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < num_workers:
+            _, i, key = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations.get(key, 0.0), i, key))
+        now, _, key = heapq.heappop(running)
+        for dependent in dependents[key]:
+            waiting[dependent].discard(key)
+            if not waiting[dependent]:
+                priority = -priorities.get(dependent, 0.0)
+                heapq.heappush(ready, (priority, order[dependent], dependent))
+    return now
+
+
+class MakespanReport:
+    """Predicted and actual makespans of a task graph run.
+    """
+
+    def __init__(self, predicted, actual, critical_path):
+        """Initialize the report.
+
+        Args:
+            predicted (float): Predicted makespan, in seconds.
+            actual (float): Actual makespan, in seconds.
+            critical_path (float): Length of the critical path of the graph,
+                in seconds, i.e. the makespan with unlimited workers.
+        """
+        self.predicted = predicted
+        self.actual = actual
+        self.critical_path = critical_path
+
+    @property
+    def error(self):
+        """Relative error of the prediction, None if the run took no time.
+        """
+        if not self.actual:
+            return None
+        return (self.predicted - self.actual) / self.actual
+
+    def __str__(self):
+        error = "n/a" if self.error is None else f"{self.error:+.0%}"
+        return (
+            f"Predicted makespan: {self.predicted:.2f}s, "
+            f"actual makespan: {self.actual:.2f}s (error {error}), "
+            f"critical path: {self.critical_path:.2f}s"
+        )
+
+
+class _Priorities:
+    """Priorities of a list of tasks, as a sequence searchable by bisect.
+    """
+
+    def __init__(self, tasks, priorities):
+        self.tasks = tasks
+        self.priorities = priorities
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __getitem__(self, i):
+        return self.priorities.get(self.tasks[i], 0.0)
+
+
+class CriticalPathScheduling(Callback):
+    """Run task graphs longest chains first, and record task statistics.
+
+    A dask callback for the local schedulers (threaded, multiprocessing,
+    synchronous). Ready tasks are started by decreasing critical path length,
+    estimated from the recorded durations. The duration and output size of
+    the tasks creating datasets are recorded, and the stats store is saved at
+    the end of the run. The predicted and actual makespans are then available
+    from `report`.
+    """
+
+    def __init__(self, task_stats, num_workers=None):
+        """Initialize the callback.
+
+        Args:
+            task_stats (TaskStats): Recorded task statistics, updated with the
+                tasks of the run.
+            num_workers (int): Number of workers of the scheduler, for the
+                makespan prediction. Defaults to the number of CPUs, as for
+                the threaded scheduler.
+        """
+        super().__init__()
+        self.task_stats = task_stats
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.priorities = {}
+        self.predicted_makespan = None
+        self.actual_makespan = None
+        self._critical_path = None
+        self._start_time = None
+        self._task_start_times = {}
+
+    def _start(self, dsk):
+        durations = task_durations(dsk, self.task_stats)
+        self.priorities = critical_path_lengths(dsk, durations)
+        self._critical_path = max(self.priorities.values(), default=0.0)
+        self.predicted_makespan = simulate_makespan(
+            dsk, durations, self.priorities, self.num_workers
+        )
+        self._start_time = time.monotonic()
+
+    def _start_state(self, dsk, state):
+        self._sort_ready(state)
+
+    def _pretask(self, key, dsk, state):
+        self._task_start_times[key] = time.monotonic()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        duration = time.monotonic() - self._task_start_times.pop(key)
+        self._record(key, dsk[key], result, duration)
+        self._insert_ready(key, state)
+
+    def _finish(self, dsk, state, errored):
+        self.actual_makespan = time.monotonic() - self._start_time
+        self.task_stats.save()
+        logger.info(str(self.report()))
+
+    def _sort_ready(self, state):
+        # The local schedulers start the last ready task first
+        state["ready"].sort(key=lambda key: self.priorities.get(key, 0.0))
+
+    def _insert_ready(self, key, state):
+        # Tasks made ready by the finished task were appended to the ready
+        # list, the rest of which is still sorted: only they are moved.
+        ready = state["ready"]
+        num_new = sum(
+            dependent not in state["waiting"]
+            for dependent in state["dependents"][key]
+        )
+        new_tasks = ready[len(ready) - num_new:]
+        del ready[len(ready) - num_new:]
+        priorities = _Priorities(ready, self.priorities)
+        for task in new_tasks:
+            position = bisect.bisect_right(
+                priorities, self.priorities.get(task, 0.0)
+            )
+            ready.insert(position, task)
+
+    def _record(self, key, task, result, duration):
+        if isinstance(key, ItemBatch):
+            items = key.items
+            results = result if isinstance(result, dict) else {}
+            duration /= len(items)
+        elif _creates_dataset(key, task):
+            items = [key]
+            results = {key: result}
+        else:
+            return
+
+        for item in items:
+            value = results.get(item)
+            memory_size = None
+            if value is not None and not isinstance(value, StoredData):
+                memory_size = estimate_size(value)
+            file_size = None
+            if isinstance(item, FileDataset) and not item.ephemeral:
+                try:
+                    info = item.file_system.info(item.relative_path)
+                    file_size = info["size"]
+                except FileNotFoundError:
+                    pass
+            self.task_stats.record(item, duration, memory_size, file_size)
+
+    def report(self):
+        """Return the makespan report of the last run.
+
+        Returns:
+            MakespanReport: The report, None if no run finished.
+        """
+        if self.actual_makespan is None:
+            return None
+        return MakespanReport(
+            self.predicted_makespan, self.actual_makespan, self._critical_path
+        )
@@ -1,41 +1,241 @@
+import heapq
 import logging
+from collections import defaultdict
 from datetime import datetime
+from pathlib import PurePath
 
 import dask
 import dask.optimization
-from dask.core import toposort
+import dask.order
+from dask.core import get_dependencies, toposort
 
 from .abc import is_dataset, is_collection
+from .collections import caching_keys
+from .datasets import FileDataset
+from .file_systems import get_filesystem_from_uri
+from .utils import estimate_size
+from . import manifests
 
 
 logger = logging.getLogger(__name__)
 
 
-def __create_task(dataset, parent_instances, in_memory_data_transfer=False):
+class StoredData:
+    """Placeholder for data transferred through storage instead of memory.
+
+    With in-memory data transfers, tasks return a StoredData object instead of
+    data that is too large to be kept in memory. The consumers of this data
+    read it from storage when they need it.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def load(self, **kwargs):
+        """Read the data from storage.
+
+        Args:
+            kwargs: Keyword arguments for reading the dataset.
+        """
+        logger.info("READ {}".format(self.dataset.catalog_path()))
+        return self.dataset.read(**kwargs)
+
+    def __repr__(self):
+        return "StoredData({})".format(self.dataset.catalog_path())
+
+
+def _load_stored_data(value, parent, read_kwargs=None):
+    """Replace StoredData placeholders by their data.
+
+    Args:
+        value: The data passed on by the task of a parent dataset or collection.
+        parent: The parent dataset or collection.
+        read_kwargs (dict): Keyword arguments for reading placeholders.
+    """
+    read_kwargs = read_kwargs or {}
+    if isinstance(value, StoredData):
+        return value.load(**read_kwargs)
+    elif is_collection(parent) and isinstance(value, dict):
+        return {
+            k: _load_stored_data(v, None, read_kwargs) for k, v in value.items()
+        }
+    else:
+        return value
+
+
+def _iter_chunks(value, parent, read_kwargs=None):
+    """Return an iterator of chunks over the data passed on by a parent.
+
+    Data in storage is read chunk by chunk when the parent supports it, and
+    at once otherwise. Items of collections are successive chunks.
+
+    Args:
+        value: The data passed on by the task of a parent dataset or collection.
+        parent: The parent dataset or collection.
+        read_kwargs (dict): Keyword arguments for reading data in storage.
+    """
+    read_kwargs = read_kwargs or {}
+    if isinstance(value, StoredData):
+        stored = value.dataset
+        if is_collection(stored):
+            return (data for _, data in stored.iter_read(**read_kwargs))
+        elif getattr(stored, "supports_chunked_reads", False):
+            return stored.read_chunks(**read_kwargs)
+    if is_collection(parent) and isinstance(value, dict):
+        return (
+            _load_stored_data(data, None, read_kwargs)
+            for data in value.values()
+        )
+    return iter([_load_stored_data(value, parent, read_kwargs)])
+
+
+def _parent_read_kwargs(dataset, parent_instances):
+    """Return the keyword arguments for reading each parent of a dataset.
+
+    Columns listed in the `parent_columns` attribute of the dataset are
+    selected when the parent (or, for collections, its items) supports it.
+
+    Args:
+        dataset (AbstractDataset): The dataset.
+        parent_instances (list): The parents of the dataset.
+
+    Returns:
+        list: A dict of keyword arguments for each parent.
+    """
+    parent_columns = getattr(dataset, "parent_columns", None)
+    if parent_columns is None:
+        return [{} for _ in parent_instances]
+
+    all_read_kwargs = []
+    for parent, columns in zip(parent_instances, parent_columns):
+        parent_class = parent.Item if is_collection(parent) else parent
+        columns_kwarg = getattr(parent_class, "columns_read_kwarg", None)
+        if columns is None or columns_kwarg is None:
+            all_read_kwargs.append({})
+        else:
+            all_read_kwargs.append({columns_kwarg: list(columns)})
+    return all_read_kwargs
+
+
+def _is_ephemeral(data_object):
+    """Tell whether a dataset, or the items of a collection, are ephemeral.
+    """
+    if is_collection(data_object):
+        return getattr(data_object.Item, "ephemeral", False)
+    return getattr(data_object, "ephemeral", False)
+
+
+def _keeps_in_memory(dataset, size, in_memory_max_bytes=None):
+    """Tell whether the output of a dataset is transferred in memory.
+
+    The `in_memory_transfer` attribute of the dataset decides, if set.
+    Otherwise, outputs are kept in memory unless their size (None if unknown)
+    exceeds in_memory_max_bytes. Datasets created chunk by chunk are never
+    held in memory at once, so they are passed on through storage by default.
+    """
+    if dataset.in_memory_transfer is not None:
+        return dataset.in_memory_transfer
+    if getattr(dataset, "create_chunks", None) is not None:
+        return False
+    return (
+        in_memory_max_bytes is None
+        or size is None
+        or size <= in_memory_max_bytes
+    )
+
+
+def __create_task(
+    dataset,
+    parent_instances,
+    in_memory_data_transfer=False,
+    write_manifest=False,
+    manifest_fingerprints=True,
+    fingerprint_cache=None,
+    in_memory_max_bytes=None,
+):
     """Create a dataset from its parents, and write it.
+
+    If write_manifest is True, the dataset manifest is written as well. It
+    records fingerprints if manifest_fingerprints is True, with those of
+    parents taken from fingerprint_cache when there. With
+    in-memory data transfers, outputs that must not be kept in memory (see
+    _keeps_in_memory) are replaced by a StoredData placeholder.
+
+    Datasets defining `create_chunks` are created chunk by chunk: their parents
+    are passed on as iterators of chunks, and the created chunks are written
+    as they come.
+
+    Ephemeral datasets are not written: their data is always passed on in
+    memory, and their children take it from their inputs.
     """
 
+    parent_read_kwargs = _parent_read_kwargs(dataset, parent_instances)
+    streaming = getattr(dataset, "create_chunks", None) is not None
+    ephemeral = _is_ephemeral(dataset)
+
     def in_memory_task(args):
         logger.info("CREATE {}".format(dataset.catalog_path()))
-        df = dataset.create(*args)
-        dataset.write(df)
+        if streaming:
+            chunk_iterators = [
+                _iter_chunks(value, parent, read_kwargs)
+                for value, parent, read_kwargs in zip(
+                    args, parent_instances, parent_read_kwargs
+                )
+            ]
+            dataset.write_chunks(dataset.create_chunks(*chunk_iterators))
+        else:
+            inputs = [
+                _load_stored_data(value, parent, read_kwargs)
+                for value, parent, read_kwargs in zip(
+                    args, parent_instances, parent_read_kwargs
+                )
+            ]
+            df = dataset.create(*inputs)
+            if ephemeral:
+                logger.info("DONE {}".format(dataset.catalog_path()))
+                return df
+            dataset.write(df)
+        if write_manifest:
+            manifests.write_manifest(
+                dataset,
+                parent_instances,
+                cache=fingerprint_cache,
+                with_fingerprints=manifest_fingerprints,
+            )
         logger.info("DONE {}".format(dataset.catalog_path()))
-        return df
+        size = None
+        if not streaming and in_memory_max_bytes is not None:
+            size = estimate_size(df)
+        if not _keeps_in_memory(dataset, size, in_memory_max_bytes):
+            return StoredData(dataset)
+        elif streaming:
+            return dataset.read()
+        else:
+            return df
 
     def from_storage_task(args):
-        # Load inputs from storage
+        # Load inputs from storage. When streaming, they are read lazily.
+        # Ephemeral parents are not stored: they are passed on in memory.
         inputs = []
-        for parent in parent_instances:
+        for value, parent, read_kwargs in zip(
+            args, parent_instances, parent_read_kwargs
+        ):
+            if _is_ephemeral(parent):
+                inputs.append(value)
+                continue
             logger.info(
                 "CREATE {} <- READ {}".format(
                     dataset.catalog_path(), parent.catalog_path()
                 )
             )
-            inputs.append(parent.read())
+            if streaming:
+                inputs.append(StoredData(parent))
+            else:
+                inputs.append(parent.read(**read_kwargs))
 
         # Plug the inputs into the in-memory task
         df = in_memory_task(inputs)
-        return None
+        return df if ephemeral else None
 
     if in_memory_data_transfer:
         return (in_memory_task, parent_instances)
@@ -49,13 +249,14 @@ def __collect_task(collection_instance, in_memory_data_transfer=False):
     When data transfers do not happen in memory, the task does nothing
     because its results will not be transfered anyway. It is necessary
     nonetheless, to register the parent-child dependency in the task graph.
+    Collections of ephemeral items are always collected in memory.
     """
     context = collection_instance.context
     ordered_keys = list(collection_instance.keys())
     parents = [collection_instance.get(key)(context) for key in ordered_keys]
 
     def task(args):
-        if in_memory_data_transfer:
+        if in_memory_data_transfer or _is_ephemeral(collection_instance):
             logger.info("COLLECT {}".format(collection_instance.catalog_path()))
             return dict(zip(ordered_keys, args))
         else:
@@ -64,22 +265,33 @@ def __collect_task(collection_instance, in_memory_data_transfer=False):
     return (task, parents)
 
 
-def __read_task(dataset, in_memory_data_transfer=False):
+def __read_task(
+    dataset, in_memory_data_transfer=False, size=None, in_memory_max_bytes=None
+):
     """Read a dataset.
 
     When data transfers do not happen in memory, the task does nothing
     because its results will not be transfered anyway. It is necessary
     nonetheless, to register the parent-child dependency in the task graph.
+
+    Datasets that must not be kept in memory (see _keeps_in_memory, with the
+    file size as estimate) are not read: consumers receive a StoredData
+    placeholder instead.
     """
 
     def task():
         logger.info("READ {}".format(dataset.catalog_path()))
         return dataset.read()
 
-    if in_memory_data_transfer:
+    def stored_data_task():
+        return StoredData(dataset)
+
+    if not in_memory_data_transfer:
+        return None
+    elif _keeps_in_memory(dataset, size, in_memory_max_bytes):
         return (task,)
     else:
-        return None
+        return (stored_data_task,)
 
 
 def _get_dataset_instances(datasets_and_collections, context):
@@ -96,19 +308,93 @@ def _get_dataset_instances(datasets_and_collections, context):
     return all_datasets
 
 
-def _create_task_graph(datasets, context, in_memory_data_transfer=False):
-    """Create the task graph spanning all datasets.
+def _collection_path(dataset):
+    """Return the catalog path of the collection of an item, None for datasets.
+    """
+    if not hasattr(dataset, "key"):
+        return None
+    # Items are named after their collection, see AbstractCollection.get
+    collection_name = dataset.name().split(":")[0]
+    return f"{dataset._catalog_module}.{collection_name}"
+
+
+def _catalog_membership(data_classes, context):
+    """Return a function telling whether a dataset belongs to the catalog.
+
+    A dataset belongs to the catalog if its class is in `data_classes`, or if
+    it is an item of a collection in `data_classes`. Collections are expanded
+    only when one of their items is looked up.
+
+    Args:
+        data_classes (list of datasets or collections): The catalog classes.
+        context (dict): Catalog context.
+
+    Returns:
+        callable: Function taking a dataset instance, and returning a bool.
+    """
+    dataset_paths = set()
+    collections = {}
+    for data_class in data_classes:
+        if is_dataset(data_class):
+            dataset_paths.add(data_class.catalog_path())
+        if is_collection(data_class):
+            collections[data_class.catalog_path()] = data_class
+    collection_keys = {}
+
+    def is_in_catalog(dataset):
+        if dataset.catalog_path() in dataset_paths:
+            return True
+        collection_path = _collection_path(dataset)
+        if collection_path not in collections:
+            return False
+        if collection_path not in collection_keys:
+            collection = collections[collection_path](context)
+            collection_keys[collection_path] = set(collection.keys())
+        return dataset.key in collection_keys[collection_path]
+
+    return is_in_catalog
+
+
+def _create_task_graph(
+    datasets,
+    context,
+    is_in_catalog=None,
+    in_memory_data_transfer=False,
+    staleness_check="mtime",
+    check_code=False,
+    in_memory_max_bytes=None,
+    fingerprint_cache=None,
+):
+    """Create the task graph needed to compute datasets.
+
+    The graph is built backward, from the datasets to their ancestors. Only
+    the collections reached on the way are expanded. Ancestors outside of the
+    catalog get no task: they are passed on as they are to their children.
 
     In the task graph, all datasets are instances (not classes), whether they
     are child or parent.
+
+    Args:
+        datasets (iterable of dataset instances): The datasets to compute.
+        context (dict): Catalog context.
+        is_in_catalog (callable): Function telling whether an ancestor belongs
+            to the catalog, see _catalog_membership. If None, all ancestors
+            do.
+        fingerprint_cache (dict): Fingerprints shared by the tasks writing
+            manifests, see _prevent_update_of_unchanging_datasets.
     """
     task_graph = {}
-    for dataset in datasets:
-        # The list `datasets` only contains dataset classes (any collection must
-        # have been expanded into datasets at this point). As a consequence,
-        # parents can only by dataset or collection classes (datasets cannot
-        # have collection filters as parents -- only the Item dataset template
-        # of a collection may have collection filters as parents).
+    datasets_to_visit = list(datasets)
+    while datasets_to_visit:
+        dataset = datasets_to_visit.pop()
+        if dataset in task_graph:
+            continue
+
+        # Datasets to visit are never collections (collections are expanded
+        # into datasets). As a consequence, parents can only by dataset or
+        # collection classes (datasets cannot have collection filters as
+        # parents -- only the Item dataset template of a collection may have
+        # collection filters as parents).
         parent_instances = [parent(context) for parent in dataset.parents]
 
         # Add the dataset creation to the graph
@@ -116,6 +402,10 @@ def _create_task_graph(datasets, context, in_memory_data_transfer=False):
             dataset,
             parent_instances,
             in_memory_data_transfer=in_memory_data_transfer,
+            write_manifest=(staleness_check == "fingerprint" or check_code),
+            manifest_fingerprints=(staleness_check == "fingerprint"),
+            fingerprint_cache=fingerprint_cache,
+            in_memory_max_bytes=in_memory_max_bytes,
         )
 
         # When a parent is a collection, add a task to build the collection
@@ -123,10 +413,21 @@ def _create_task_graph(datasets, context, in_memory_data_transfer=False):
         # needs it ; but don't do it for collections that do not need to be
         # collected at once since they may not hold in memory.
         for parent in parent_instances:
-            if is_collection(parent):
+            if not is_collection(parent):
+                ancestors = [parent]
+            elif parent not in task_graph:
                 task_graph[parent] = __collect_task(
                     parent, in_memory_data_transfer=in_memory_data_transfer,
                 )
+                _, ancestors = task_graph[parent]
+            else:
+                continue
+            datasets_to_visit.extend(
+                ancestor
+                for ancestor in ancestors
+                if ancestor not in task_graph
+                and (is_in_catalog is None or is_in_catalog(ancestor))
+            )
 
     return task_graph
 
@@ -143,16 +444,171 @@ def _prune_task_graph(task_graph, target_datasets):
     return new_task_graph
 
 
+def _take_storage_snapshot(data_objects, sizes=None):
+    """Collect the storage state of file datasets, listing each folder once.
+
+    Datasets are grouped by parent folder, so that a single listing per folder
+    answers for the existence and last update time of all datasets it contains.
+    Datasets alone in their folder are rather looked up together, with
+    concurrent requests on file systems that support it.
+
+    Args:
+        data_objects (iterable): datasets and collections of the task graph.
+        sizes (dict): If set, the file size of each existing dataset is saved
+            in it.
+
+    Returns:
+        dict: For each file dataset, its last update time, or None if it does
+            not exist.
+    """
+    folders = defaultdict(list)
+    for data_object in data_objects:
+        if isinstance(data_object, FileDataset) and not data_object.ephemeral:
+            parent_path = PurePath(data_object.relative_path).parent
+            folder_uri = data_object.file_system.uri(parent_path)
+            folders[folder_uri].append(data_object)
+
+    def record(dataset, file_details):
+        snapshot[dataset] = (
+            file_details["last_update_time"] if file_details else None
+        )
+        if file_details and sizes is not None:
+            sizes[dataset] = file_details["size"]
+
+    snapshot = {}
+    single_datasets = defaultdict(list)
+    for datasets in folders.values():
+        file_system = datasets[0].file_system
+        if len(datasets) == 1:
+            single_datasets[file_system].append(datasets[0])
+            continue
+        parent_path = PurePath(datasets[0].relative_path).parent
+        details = file_system.listdir_details(parent_path)
+        for dataset in datasets:
+            record(dataset, details.get(PurePath(dataset.relative_path).name))
+
+    for file_system, datasets in single_datasets.items():
+        infos = file_system.info_many([d.relative_path for d in datasets])
+        for dataset in datasets:
+            record(dataset, infos[dataset.relative_path])
+
+    return snapshot
+
+
+def _is_source(dataset):
+    """Tell whether a dataset has no parents, i.e. is not created from others.
+    """
+    return is_dataset(dataset) and not dataset.parents
+
+
+def _is_suspect(catalog_manifest, dataset, snapshot, sizes):
+    """Tell whether a dataset changed since recorded in the catalog manifest.
+
+    Args:
+        catalog_manifest (CatalogManifest): The catalog manifest, recording the
+            dataset.
+        dataset (FileDataset): The dataset.
+        snapshot (dict): Last update times in storage, see
+            _take_storage_snapshot.
+        sizes (dict): File sizes in storage.
+    """
+    if snapshot[dataset] != catalog_manifest.last_update_time(dataset):
+        return True
+    recorded_size = catalog_manifest.size(dataset)
+    return recorded_size is not None and sizes.get(dataset) != recorded_size
+
+
+def _stored_update_time(dataset, snapshot):
+    """Return the last update time of a dataset, None if it does not exist.
+
+    The storage snapshot is used when it covers the dataset, otherwise the
+    storage is accessed directly and the snapshot completed.
+    """
+    if dataset not in snapshot:
+        if dataset.exists():
+            snapshot[dataset] = dataset.last_update_time()
+        else:
+            snapshot[dataset] = None
+    return snapshot[dataset]
+
+
 def _prevent_update_of_unchanging_datasets(
-    task_graph, in_memory_data_transfer=False
+    task_graph,
+    in_memory_data_transfer=False,
+    staleness_check="mtime",
+    check_code=False,
+    catalog_manifest=None,
+    in_memory_max_bytes=None,
+    target_datasets=(),
+    file_sizes=None,
+    fingerprint_cache=None,
 ):
     """Modify the task graph to prevent computing datasets that will not change.
 
     The resulting task graph can be optimized by pruning parts that have become
     disconnected from the computation of targets.
+
+    With staleness_check set to "mtime", an existing dataset is updated if one
+    of its parents has a later update time. With "fingerprint", it is updated
+    if the fingerprint of one of its parents differs from the one recorded in
+    the dataset manifest (update times are compared for datasets without
+    manifest). If check_code is True, a dataset is also updated if its code
+    differs from the one recorded in its manifest.
+
+    If a catalog manifest is given, the storage state of the datasets it
+    records is taken from it, without accessing storage. Other datasets are
+    checked in storage, and so are source datasets (without parents), which
+    can change outside of task graphs. Recorded entries of source datasets
+    whose update time or size changed are ignored. The catalog manifest is
+    then updated: datasets that will be updated are removed from it, and the
+    state of other datasets is recorded.
+
+    If file_sizes is set, the file size of each existing dataset is saved in
+    it. If fingerprint_cache is set, the fingerprints computed for datasets and
+    collections that will not change are saved in it, so that the tasks
+    writing manifests do not compute them again.
     """
     sorted_data_objects = toposort(task_graph)
 
+    # Fetch the state of all datasets in storage beforehand, in as few storage
+    # accesses as possible. The decisions below only rely on this snapshot.
+    # Datasets recorded in the catalog manifest need no storage access.
+    sizes = {} if file_sizes is None else file_sizes
+    dataset_manifests = {}
+    fingerprints = {}
+    if catalog_manifest is None:
+        snapshot = _take_storage_snapshot(sorted_data_objects, sizes=sizes)
+    else:
+        recorded = [d for d in sorted_data_objects if d in catalog_manifest]
+        snapshot = _take_storage_snapshot(
+            (
+                d
+                for d in sorted_data_objects
+                if d not in catalog_manifest or _is_source(d)
+            ),
+            sizes=sizes,
+        )
+        for dataset in recorded:
+            if dataset in snapshot and _is_suspect(
+                catalog_manifest, dataset, snapshot, sizes
+            ):
+                logger.info(
+                    "{} changed since recorded in the catalog manifest".format(
+                        dataset.catalog_path()
+                    )
+                )
+                continue
+            snapshot[dataset] = catalog_manifest.last_update_time(dataset)
+            sizes[dataset] = catalog_manifest.size(dataset)
+            manifest = catalog_manifest.manifest(dataset)
+            if manifest is not None:
+                dataset_manifests[dataset] = manifest
+                recorded_time = manifest["last_update_time"]
+                if "fingerprint" in manifest and (
+                    recorded_time == snapshot[dataset].isoformat()
+                ):
+                    fingerprints[dataset] = manifest["fingerprint"]
+
     # A data object will be added to data_objects_to_update if it needs
     # updating. Otherwise, its last update time will be recorded in
     # last_update_times. Because we address data objects in topological sort
@@ -165,9 +621,6 @@ def _prevent_update_of_unchanging_datasets(
         parents_to_update = data_objects_to_update.intersection(parents)
         has_parents_to_update = bool(parents_to_update)
 
-        # The order of tests below tries to minimize access to storage,
-        # which can be time-consuming (depending on storage type and graph size)
-
         # If it's a collection: update if any member item must be updated
         if is_collection(data_object):
             requires_update = has_parents_to_update
@@ -180,16 +633,49 @@ def _prevent_update_of_unchanging_datasets(
                 )
 
         # If it's not a collection, then it's a dataset
-        elif has_parents_to_update or (not data_object.exists()):
+        elif has_parents_to_update:
+            requires_update = True
+
+        elif _is_ephemeral(data_object):
+            # Ephemeral datasets are transparent: they are as recent as their
+            # parents. They are created only if a child needs them (see below).
+            requires_update = False
+            update_time_parents = {last_update_times[p] for p in parents}
+            last_update_times[data_object] = max(
+                update_time_parents,
+                default=datetime.fromtimestamp(0).astimezone(),
+            )
+
+        elif _stored_update_time(data_object, snapshot) is None:
+            # The dataset does not exist
             requires_update = True
 
         else:
             # The dataset exists and none of its parents must be updated.
-            # Yet it will need an update if one of its parents has a later
-            # update time.
+            # Yet it will need an update if its code changed, or if one of its
+            # parents has a later update time (or different contents).
             update_time_parents = {last_update_times[p] for p in parents}
-            t = data_object.last_update_time()
-            requires_update = any({tp > t for tp in update_time_parents})
+            t = snapshot[data_object]
+            manifest = None
+            if staleness_check == "fingerprint" or check_code:
+                if data_object not in dataset_manifests:
+                    dataset_manifests[data_object] = manifests.read_manifest(
+                        data_object
+                    )
+                manifest = dataset_manifests[data_object]
+
+            inputs_changed = None
+            if staleness_check == "fingerprint":
+                inputs_changed = manifests.inputs_changed(
+                    manifest, parents, snapshot, fingerprints
+                )
+
+            if check_code and manifests.code_changed(manifest, data_object):
+                requires_update = True
+            elif inputs_changed is None:
+                requires_update = any({tp > t for tp in update_time_parents})
+            else:
+                requires_update = inputs_changed
             if not requires_update:
                 # Save the last update time
                 last_update_times[data_object] = t
@@ -197,6 +683,47 @@ def _prevent_update_of_unchanging_datasets(
         if requires_update:
             data_objects_to_update.add(data_object)
 
+    # Ephemeral datasets are not stored, so they must be created whenever a
+    # child is updated, or when they are targets.
+    children = defaultdict(list)
+    for data_object in sorted_data_objects:
+        for parent in task_graph[data_object][1]:
+            children[parent].append(data_object)
+    targets = set(target_datasets)
+    for data_object in reversed(sorted_data_objects):
+        if _is_ephemeral(data_object) and (
+            data_object in targets
+            or data_objects_to_update.intersection(children[data_object])
+        ):
+            data_objects_to_update.add(data_object)
+
+    if catalog_manifest is not None:
+        _update_catalog_manifest(
+            catalog_manifest,
+            sorted_data_objects,
+            data_objects_to_update,
+            last_update_times,
+            sizes,
+            dataset_manifests,
+        )
+
+    if fingerprint_cache is not None:
+        fingerprint_cache.update(
+            (data_object, value)
+            for data_object, value in fingerprints.items()
+            if data_object not in data_objects_to_update
+        )
+
+    # The folders of the items of a collection are created in bulk, by the
+    # first task writing an item.
+    for dataset, directories in _collection_directories(
+        data_objects_to_update
+    ).items():
+        if len(task_graph[dataset]) > 1:
+            task_graph[dataset] = __make_directories_task(
+                task_graph[dataset], directories
+            )
+
     # For datasets that will not change, the "create dataset" task is replaced
     # by a "read from storage" task without parents. For collections, the
     # "collect" task remains the same, whether the collection needs updating
@@ -207,14 +734,427 @@ def _prevent_update_of_unchanging_datasets(
     unchanging_datasets = {d for d in unchanging_objects if is_dataset(d)}
     for dataset in unchanging_datasets:
         task_graph[dataset] = __read_task(
-            dataset, in_memory_data_transfer=in_memory_data_transfer
+            dataset,
+            in_memory_data_transfer=in_memory_data_transfer,
+            size=sizes.get(dataset),
+            in_memory_max_bytes=in_memory_max_bytes,
         )
 
     return task_graph
 
 
+class _Directories:
+    """Folders of collection items, created at once when first needed.
+
+    No lock guards the creation, so that tasks remain picklable: concurrent
+    tasks may both create the folders, which is harmless.
+    """
+
+    def __init__(self, file_system, paths):
+        self.file_system = file_system
+        self.paths = paths
+        self.created = False
+
+    def create(self):
+        if not self.created:
+            self.file_system.mkdirs(self.paths)
+            self.created = True
+
+
+def _collection_directories(data_objects):
+    """Group the folders of collection items to write, by collection.
+
+    Returns:
+        dict: The folders (see _Directories) to create before writing each
+          item, shared by the items of the same collection.
+    """
+    folders = defaultdict(set)
+    items = defaultdict(list)
+    for data_object in data_objects:
+        if (
+            isinstance(data_object, FileDataset)
+            and not data_object.ephemeral
+            and _collection_path(data_object) is not None
+        ):
+            group = (_collection_path(data_object), data_object.file_system)
+            folders[group].add(PurePath(data_object.relative_path).parent)
+            items[group].append(data_object)
+
+    directories = {}
+    for group, paths in folders.items():
+        shared = _Directories(group[1], paths)
+        directories.update((item, shared) for item in items[group])
+    return directories
+
+
+def __make_directories_task(task, directories):
+    """Make a create task first create the folders of its collection.
+    """
+    func, parents = task
+
+    def task_in_directories(args):
+        directories.create()
+        return func(args)
+
+    return (task_in_directories, parents)
+
+
+class ItemBatch:
+    """Key of a task computing several items of a collection at once.
+
+    The task returns a dict with the result of each item, indexed by item.
+    """
+
+    def __init__(self, items):
+        self.items = tuple(items)
+
+    def __hash__(self):
+        return hash(tuple(item.catalog_path() for item in self.items))
+
+    def __eq__(self, other):
+        return isinstance(other, ItemBatch) and self.items == other.items
+
+    def __repr__(self):
+        return "ItemBatch({}, {} items)".format(
+            self.items[0].catalog_path(), len(self.items)
+        )
+
+
+def __batch_task(items, item_tasks):
+    """Run the tasks of several items in a loop, in a single task.
+    """
+    # Tasks with parents are (func, parents), others are read tasks (func,)
+    funcs = []
+    num_parents = []
+    parents = []
+    for item_task in item_tasks:
+        funcs.append(item_task[0])
+        if len(item_task) > 1:
+            num_parents.append(len(item_task[1]))
+            parents.extend(item_task[1])
+        else:
+            num_parents.append(None)
+
+    def task(args):
+        results = {}
+        offset = 0
+        for item, func, n in zip(items, funcs, num_parents):
+            if n is None:
+                results[item] = func()
+            else:
+                results[item] = func(args[offset : offset + n])
+                offset += n
+        return results
+
+    return (task, parents)
+
+
+def __unbatch_inputs_task(task, batches):
+    """Adapt a task to inputs computed by batch tasks.
+
+    Parents may be nested tasks (see _fuse_ephemeral_datasets), which are
+    adapted as well.
+
+    Args:
+        task (tuple): The task, whose parents may be batched items.
+        batches (dict): The batch of each batched item.
+    """
+    func, parents = task
+    parents = [
+        __unbatch_inputs_task(parent, batches)
+        if isinstance(parent, tuple)
+        else parent
+        for parent in parents
+    ]
+    selected_items = [
+        None if isinstance(parent, tuple) or parent not in batches else parent
+        for parent in parents
+    ]
+
+    def unbatched_func(args):
+        inputs = [
+            value if item is None else value[item]
+            for value, item in zip(args, selected_items)
+        ]
+        return func(inputs)
+
+    new_parents = [
+        parent if item is None else batches[item]
+        for parent, item in zip(parents, selected_items)
+    ]
+    return (unbatched_func, new_parents)
+
+
+def _batch_collection_items(task_graph, target_datasets, batch_size):
+    """Group the tasks of sibling collection items into batch tasks.
+
+    Siblings are items of the same collection, at the same depth in the graph
+    (so that they do not depend on one another), with tasks of the same shape.
+    Each batch task runs the tasks of up to `batch_size` items in a loop.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        target_datasets (list of dataset instances): datasets that must be
+            computed.
+        batch_size (int): Maximum number of items per batch.
+
+    Returns:
+        tuple: The new task graph, and the new list of targets, in which
+            batched items are replaced by their batch.
+    """
+    depths = {}
+    siblings = defaultdict(list)
+    for data_object in toposort(task_graph):
+        task = task_graph[data_object]
+        dependencies = get_dependencies(task_graph, data_object)
+        depths[data_object] = 1 + max(
+            (depths[d] for d in dependencies), default=-1
+        )
+        collection_path = _collection_path(data_object)
+        if collection_path is not None and isinstance(task, tuple):
+            shape = len(task[1]) if len(task) > 1 else None
+            sibling_key = (collection_path, depths[data_object], shape)
+            siblings[sibling_key].append(data_object)
+
+    new_task_graph = dict(task_graph)
+    batches = {}
+    for items in siblings.values():
+        for start in range(0, len(items), batch_size):
+            batch_items = items[start : start + batch_size]
+            if len(batch_items) < 2:
+                continue
+            batch = ItemBatch(batch_items)
+            new_task_graph[batch] = __batch_task(
+                batch_items, [new_task_graph.pop(item) for item in batch_items]
+            )
+            batches.update((item, batch) for item in batch_items)
+
+    # Tasks that take batched items as inputs now take their batch
+    for key, task in new_task_graph.items():
+        if get_dependencies(batches, task=task):
+            new_task_graph[key] = __unbatch_inputs_task(task, batches)
+
+    new_targets = list(
+        dict.fromkeys(batches.get(target, target) for target in target_datasets)
+    )
+    return new_task_graph, new_targets
+
+
+def _fuse_ephemeral_datasets(task_graph, target_datasets):
+    """Fuse the tasks of ephemeral datasets into the tasks of their children.
+
+    An ephemeral dataset with a single child is computed within the task of
+    its child, so that chains of ephemeral datasets run as a single task.
+    Other tasks are left unchanged.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        target_datasets (list of dataset instances): datasets that must be
+            computed.
+    """
+    if not any(_is_ephemeral(data_object) for data_object in task_graph):
+        return task_graph
+    kept_keys = [
+        data_object
+        for data_object in task_graph
+        if not _is_ephemeral(data_object)
+    ]
+    kept_keys.extend(target_datasets)
+    fused_task_graph, _ = dask.optimization.fuse(
+        task_graph, keys=kept_keys, rename_keys=False, fuse_subgraphs=False
+    )
+    return fused_task_graph
+
+
+def __spill_task(dataset, task):
+    """Make a task pass its output on through storage, see StoredData.
+
+    Read tasks no longer read the dataset. Create tasks still create and write
+    the dataset, but return a StoredData placeholder instead of the data.
+    """
+
+    def stored_data_task():
+        return StoredData(dataset)
+
+    if len(task) == 1:
+        return (stored_data_task,)
+
+    func, parents = task
+
+    def spilled_task(args):
+        func(args)
+        return StoredData(dataset)
+
+    return (spilled_task, parents)
+
+
+def _estimate_output_sizes(
+    task_graph, file_sizes, task_stats=None, in_memory_max_bytes=None
+):
+    """Estimate the size in memory of the output of each dataset task.
+
+    The size in memory recorded in task stats is used if known, otherwise the
+    file size of the dataset. Outputs passed on through storage anyway (see
+    _keeps_in_memory) take no memory. Unknown sizes are taken as zero.
+
+    Args:
+        task_graph (dict): dask-style task graph.
+        file_sizes (dict): File sizes of existing datasets.
+        task_stats (TaskStats): Recorded task statistics, if any.
+        in_memory_max_bytes (int): See create_task_graph.
+
+    Returns:
+        dict: The estimated size of each dataset output, in bytes.
+    """
+    sizes = {}
+    for data_object in task_graph:
+        if not is_dataset(data_object):
+            continue
+        size = None
+        if task_stats is not None:
+            size = task_stats.memory_size(data_object)
+        if size is None:
+            size = file_sizes.get(data_object)
+        if size is None and task_stats is not None:
+            size = task_stats.file_size(data_object)
+        if not _keeps_in_memory(data_object, size, in_memory_max_bytes):
+            size = 0
+        sizes[data_object] = size or 0
+    return sizes
+
+
+def _spill_over_memory_budget(task_graph, target_datasets, sizes, budget):
+    """Pass outputs on through storage, so that data in memory fits a budget.
+
+    Tasks are expected to run in the order of dask.order, which the local
+    schedulers follow, and which runs consumers soon after their producers.
+    Along this order, an output is held in memory from its task to its last
+    consumer, or to the end for targets. Items of a collection are held until
+    the last consumer of the collection. Whenever the data held exceeds the
+    budget, the outputs used again the latest are spilled: their tasks return
+    a StoredData placeholder, and their consumers read them from storage.
+
+    Ephemeral datasets, and datasets with `in_memory_transfer` set, are not
+    spilled.
+
+    Args:
+        task_graph (dict): dask-style task graph, with in-memory transfers.
+        target_datasets (list of dataset instances): datasets that must be
+            computed.
+        sizes (dict): Estimated size of dataset outputs, see
+            _estimate_output_sizes.
+        budget (int): Maximum size of data held in memory, in bytes.
+
+    Returns:
+        dict: The task graph, with the tasks of spilled datasets modified.
+    """
+    sequence = sorted(task_graph, key=dask.order.order(task_graph).get)
+    positions = {key: i for i, key in enumerate(sequence)}
+
+    # Positions of the tasks using each output
+    uses = defaultdict(list)
+    for key in sequence:
+        for dependency in get_dependencies(task_graph, key):
+            uses[dependency].append(positions[key])
+    for target in target_datasets:
+        uses[target].append(len(sequence))
+    for key in sequence:
+        if is_collection(key):
+            for item in get_dependencies(task_graph, key):
+                uses[item].extend(uses[key])
+
+    def spillable(data_object):
+        return (
+            isinstance(data_object, FileDataset)
+            and not data_object.ephemeral
+            and data_object.in_memory_transfer is None
+        )
+
+    def next_use(data_object, position):
+        return min(u for u in uses[data_object] if u >= position)
+
+    held = {}
+    held_bytes = 0
+    releases = []
+    spilled = set()
+    for position, key in enumerate(sequence):
+        # Release the outputs that are no longer used
+        while releases and releases[0][0] < position:
+            _, _, released = heapq.heappop(releases)
+            held_bytes -= held.pop(released, 0)
+
+        size = sizes.get(key, 0)
+        if not size:
+            continue
+        held[key] = size
+        held_bytes += size
+        heapq.heappush(
+            releases, (max(uses[key], default=-1), positions[key], key)
+        )
+
+        while held_bytes > budget:
+            candidates = [d for d in held if spillable(d)]
+            if not candidates:
+                break
+            spilled_key = max(candidates, key=lambda d: next_use(d, position))
+            held_bytes -= held.pop(spilled_key)
+            spilled.add(spilled_key)
+
+    if spilled:
+        logger.info(
+            "Pass {} datasets through storage to fit the memory budget".format(
+                len(spilled)
+            )
+        )
+    for dataset in spilled:
+        task_graph[dataset] = __spill_task(dataset, task_graph[dataset])
+    return task_graph
+
+
+def _update_catalog_manifest(
+    catalog_manifest,
+    data_objects,
+    data_objects_to_update,
+    last_update_times,
+    sizes,
+    dataset_manifests,
+):
+    """Record the storage state of datasets in the catalog manifest, and save.
+
+    Datasets to update are removed from the manifest, so that their state is
+    checked in storage when the next task graph is created.
+    """
+    for data_object in data_objects:
+        if (
+            is_collection(data_object)
+            or not isinstance(data_object, FileDataset)
+            or data_object.ephemeral
+        ):
+            continue
+        if data_object in data_objects_to_update:
+            catalog_manifest.discard(data_object)
+        else:
+            catalog_manifest.record(
+                data_object,
+                last_update_times[data_object],
+                size=sizes.get(data_object),
+                manifest=dataset_manifests.get(data_object),
+            )
+    catalog_manifest.save()
+
+
 def create_task_graph(
-    data_classes, context, targets=None, in_memory_data_transfer=False
+    data_classes,
+    context,
+    targets=None,
+    in_memory_data_transfer=False,
+    staleness_check="mtime",
+    check_code=False,
+    use_catalog_manifest=False,
+    in_memory_max_bytes=None,
+    batch_size=None,
+    memory_budget=None,
+    task_stats=None,
 ):
     """Create a task graph, optimized to compute targets.
 
@@ -224,34 +1164,126 @@ def create_task_graph(
             dependencies).
         context (dict): Catalog context.
         targets (list of datasets or collections): Catalog classes that must be
-            computed. If None, all items in data_classes are computed.
+            computed. If None, all items in data_classes are computed,
+            except ephemeral datasets, which are computed only as inputs of
+            other datasets.
         in_memory_data_transfer (bool): If True, let Dask transfer outputs of a
             task into inputs of the next, in memory. If False, each task reads
             its inputs from storage, and values transferred by Dask are set to
             None. This reduces the memory footprint of the application, at the
             expense of more storage accesses.
+        in_memory_max_bytes (int): With in-memory data transfers, maximum size
+            of data passed on in memory. Larger outputs are read from storage
+            by the tasks that need them, and tasks return a StoredData
+            placeholder instead. Sizes are estimated in memory for created
+            datasets, and from file sizes for datasets read from storage. The
+            `in_memory_transfer` attribute of a dataset, if set, takes
+            precedence.
+        staleness_check (str): How to detect datasets that must be updated.
+            With "mtime", a dataset is updated when a parent has a later update
+            time. With "fingerprint", a dataset is updated when the contents of
+            a parent changed since the dataset was created, as recorded in the
+            dataset manifest. Fingerprints are the ETag on S3, and the file
+            size and hash on local storage.
+        check_code (bool): If True, a dataset is also updated when its code
+            changed since it was created, as recorded in the dataset manifest.
+            The code covers the `create` method source, the `parents`, and the
+            read and write keyword arguments. Datasets without manifest are
+            not updated because of code changes.
+        use_catalog_manifest (bool): If True, the storage state of datasets is
+            loaded from the catalog manifest, a single file at the catalog
+            root, and only datasets missing from it are checked in storage.
+            The manifest is updated after checks. Datasets scheduled for
+            update are removed from it, so that they are checked again next
+            time. Changes made in storage outside of task graphs are not
+            detected for datasets recorded in the manifest.
+        batch_size (int): If set, the tasks of sibling collection items are
+            grouped into batch tasks of up to batch_size items, each running
+            its item tasks in a loop. This reduces scheduling overhead for
+            large collections of small items. Batched items are replaced in
+            the returned targets by their batch (an ItemBatch), whose result
+            is a dict indexed by item.
+        memory_budget (int): With in-memory data transfers, maximum size of
+            the data held in memory at once, in bytes. Along the order in
+            which Dask runs tasks, outputs are held until their last consumer
+            runs. When they would exceed the budget, the outputs used again
+            the latest are passed on through storage instead (see
+            in_memory_max_bytes). The budget assumes tasks run one at a time:
+            leave room for the outputs of concurrent tasks.
+        task_stats (TaskStats): Recorded task statistics (see
+            data_catalog.stats), from which output sizes are estimated for
+            the memory budget. Without stats, or for datasets without
+            records, output sizes are estimated from file sizes.
+
+    Returns:
+        tuple: The task graph, and the list of targets, i.e. the keys of the
+            task graph to compute.
     """
-    # Create dataset instances from dataset/collection classes in inputs
+    if staleness_check not in {"mtime", "fingerprint"}:
+        raise ValueError(f"Unknown staleness check {staleness_check}.")
+
+    # Create dataset instances of targets. Collection keys are listed once for
+    # the whole graph construction.
     logger.info("Create task graph")
-    all_datasets = _get_dataset_instances(data_classes, context)
-    if targets:
-        target_datasets = list(_get_dataset_instances(targets, context))
-    else:
-        target_datasets = list(all_datasets)
+    with caching_keys():
+        if targets:
+            target_datasets = list(_get_dataset_instances(targets, context))
+        else:
+            # Ephemeral datasets are only computed for their children
+            target_datasets = [
+                data_object
+                for data_object in _get_dataset_instances(data_classes, context)
+                if not _is_ephemeral(data_object)
+            ]
 
-    # Create the task graph
-    task_graph = _create_task_graph(
-        all_datasets, context, in_memory_data_transfer=in_memory_data_transfer
-    )
+        # Create the task graph, restricted to what targets need. The tasks
+        # writing manifests share fingerprints, including those computed to
+        # optimize the graph.
+        fingerprint_cache = {}
+        task_graph = _create_task_graph(
+            target_datasets,
+            context,
+            is_in_catalog=_catalog_membership(data_classes, context),
+            in_memory_data_transfer=in_memory_data_transfer,
+            staleness_check=staleness_check,
+            check_code=check_code,
+            in_memory_max_bytes=in_memory_max_bytes,
+            fingerprint_cache=fingerprint_cache,
+        )
 
-    # Optimize the task graph, first by restricting to the subgraph useful to
-    # compute targets, then by removing datasets that will not change. The first
-    # pruning reduces storage access when detecting unchanging datasets.
-    logger.info("Optimize task graph")
-    task_graph = _prune_task_graph(task_graph, target_datasets)
-    task_graph = _prevent_update_of_unchanging_datasets(
-        task_graph, in_memory_data_transfer=in_memory_data_transfer
-    )
-    task_graph = _prune_task_graph(task_graph, target_datasets)
+        # Optimize the task graph, by removing datasets that will not change
+        logger.info("Optimize task graph")
+        catalog_manifest = None
+        file_sizes = {}
+        if use_catalog_manifest:
+            file_system = get_filesystem_from_uri(
+                context["catalog_uri"], **context.get("fs_kwargs", {})
+            )
+            catalog_manifest = manifests.CatalogManifest.load(file_system)
+
+        task_graph = _prevent_update_of_unchanging_datasets(
+            task_graph,
+            in_memory_data_transfer=in_memory_data_transfer,
+            staleness_check=staleness_check,
+            check_code=check_code,
+            catalog_manifest=catalog_manifest,
+            in_memory_max_bytes=in_memory_max_bytes,
+            target_datasets=target_datasets,
+            file_sizes=file_sizes,
+            fingerprint_cache=fingerprint_cache,
+        )
+        task_graph = _prune_task_graph(task_graph, target_datasets)
+        if in_memory_data_transfer and memory_budget is not None:
+            sizes = _estimate_output_sizes(
+                task_graph, file_sizes, task_stats, in_memory_max_bytes
+            )
+            task_graph = _spill_over_memory_budget(
+                task_graph, target_datasets, sizes, memory_budget
+            )
+        task_graph = _fuse_ephemeral_datasets(task_graph, target_datasets)
+        if batch_size:
+            task_graph, target_datasets = _batch_collection_items(
+                task_graph, target_datasets, batch_size
+            )
 
     return task_graph, target_datasets
@@ -5,6 +5,7 @@ from pathlib import PurePath
 import inspect
 from functools import partial
 import re
+import sys
 
 from .abc import is_dataset, is_collection
 
@@ -21,6 +22,48 @@ def _find_mandatory_arguments(func):
     return mandatory_arguments
 
 
+def _freeze(value):
+    """Convert a value into a hashable equivalent.
+
+    Dicts, lists, tuples and sets are converted recursively. Other unhashable
+    values are replaced by their repr.
+    """
+    if isinstance(value, dict):
+        return tuple(
+            sorted(((k, _freeze(v)) for k, v in value.items()), key=repr)
+        )
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def estimate_size(data):
+    """Estimate the memory footprint of data, in bytes.
+
+    Pandas objects and arrays report their own size; dicts, lists and tuples
+    are explored recursively. Other objects are measured by sys.getsizeof.
+    """
+    if hasattr(data, "memory_usage"):
+        usage = data.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    elif hasattr(data, "nbytes"):
+        return int(data.nbytes)
+    elif isinstance(data, dict):
+        return sys.getsizeof(data) + sum(
+            estimate_size(value) for value in data.values()
+        )
+    elif isinstance(data, (list, tuple)):
+        return sys.getsizeof(data) + sum(estimate_size(x) for x in data)
+    else:
+        return sys.getsizeof(data)
+
+
 def keys_from_folder(relative_folder_path):
     """
     TBD
@@ -0,0 +1,67 @@
+import pytest
+
+import pandas as pd
+
+from data_catalog.caches import ReadCache, reader_copy
+
+
+class TestReadCache:
+    def should_return_cached_data(self):
+        cache = ReadCache(max_bytes=10000)
+        assert cache.get("a", 1) == (False, None)
+
+        cache.put("a", 1, [1, 2])
+        assert cache.get("a", 1) == (True, [1, 2])
+        assert cache.get("a", 2) == (False, None)
+
+    def should_replace_other_versions(self):
+        cache = ReadCache(max_bytes=10000)
+        cache.put("a", 1, [1, 2])
+        cache.put("a", 2, [3])
+        assert cache.get("a", 1) == (False, None)
+        assert cache.get("a", 2) == (True, [3])
+
+    def should_evict_least_recently_used_data(self):
+        cache = ReadCache(max_bytes=10000)
+        cache.put("a", 1, [0] * 10)
+        entry_size = cache.num_bytes
+        cache.resize(2 * entry_size)
+        cache.put("b", 1, [0] * 10)
+        cache.get("a", 1)
+        cache.put("c", 1, [0] * 10)
+
+        assert cache.get("a", 1)[0]
+        assert not cache.get("b", 1)[0]
+        assert cache.get("c", 1)[0]
+        assert cache.num_bytes == 2 * entry_size
+
+    def should_not_cache_data_larger_than_cache(self):
+        cache = ReadCache(max_bytes=10)
+        cache.put("a", 1, list(range(100)))
+        assert cache.get("a", 1) == (False, None)
+        assert cache.num_bytes == 0
+
+    def should_invalidate_paths(self):
+        cache = ReadCache(max_bytes=10000)
+        cache.put("a", 1, [1])
+        cache.put("b", 1, [1])
+        cache.invalidate("a")
+        assert not cache.get("a", 1)[0]
+        assert cache.get("b", 1)[0]
+
+        cache.clear()
+        assert not cache.get("b", 1)[0]
+        assert cache.num_bytes == 0
+
+
+class TestReaderCopy:
+    def should_copy_data(self):
+        df = pd.DataFrame({"a": [1, 2]})
+        df_copy = reader_copy(df)
+        df_copy.loc[0, "a"] = 10
+        assert df["a"].tolist() == [1, 2]
+
+        data = {"a": [1, 2]}
+        data_copy = reader_copy(data)
+        data_copy["a"].append(3)
+        assert data == {"a": [1, 2]}
@@ -1,5 +1,6 @@
 from pathlib import Path, PurePath
 import pickle
+import threading
 
 import pytest
 import pandas as pd
@@ -51,6 +52,16 @@ class CollectionForPickleTest(dc.AbstractCollection):
         pass
 
 
+class FileCollectionForPickleTest(dc.FileCollection):
+    """A file collection, filtered in a pickle test.
+    """
+
+    keys = lambda self: ["key_a", "key_b"]
+
+    class Item(dd.PickleDataset):
+        pass
+
+
 class TestAbstractCollection:
     def should_have_mandatory_attributes(self):
         # Missing keys
@@ -81,6 +92,28 @@ class TestAbstractCollection:
     def should_create_class_for_each_item(self, misc_collection):
         assert issubclass(misc_collection.get("key_a"), misc_collection.Item)
 
+    def should_cache_item_classes(self, misc_collection):
+        assert misc_collection.get("key_a") is misc_collection.get("key_a")
+        assert misc_collection.get("key_a") is not misc_collection.get("key_b")
+
+    def should_bound_item_class_cache(self):
+        class BoundedCollection(dc.AbstractCollection):
+            keys = lambda self: ["key_a", "key_b"]
+            item_cache_size = 1
+
+            class Item(dd.AbstractDataset):
+                pass
+
+        item_a = BoundedCollection.get("key_a")
+        assert BoundedCollection.get("key_a") is item_a
+        BoundedCollection.get("key_b")
+        assert len(BoundedCollection._item_classes) == 1
+
+        # The evicted class is created anew, but remains equal
+        new_item_a = BoundedCollection.get("key_a")
+        assert new_item_a is not item_a
+        assert new_item_a == item_a
+
     def should_let_create_multiple_items(self, misc_collection):
         several_items = misc_collection.get(["key_a", "key_b"])
         assert isinstance(several_items, dict)
@@ -270,6 +303,165 @@ class TestFileCollection:
         df_a = folder_collection(context).read(["file_a"])
         assert df_a.keys() == {"file_a"}
 
+    def should_read_datasets_concurrently(self, folder_collection):
+        datasets_path = Path(__file__).parent / "examples"
+        context = {"catalog_uri": datasets_path.absolute().as_uri()}
+
+        all_dfs = folder_collection(context).read(
+            ["file_b", "file_a"], max_workers=2, max_inflight_bytes=1
+        )
+        assert list(all_dfs) == ["file_b", "file_a"]
+        assert all_dfs["file_b"].shape == (2, 3)
+
+        context["read_max_workers"] = 4
+        all_dfs = folder_collection(context).read()
+        assert all_dfs.keys() == {"file_a", "file_b"}
+
+    def should_iterate_over_datasets(self, folder_collection):
+        datasets_path = Path(__file__).parent / "examples"
+        context = {"catalog_uri": datasets_path.absolute().as_uri()}
+        collection = folder_collection(context)
+
+        for prefetch in [0, 1, 3]:
+            items = list(
+                collection.iter_read(["file_b", "file_a"], prefetch=prefetch)
+            )
+            assert [key for key, _ in items] == ["file_b", "file_a"]
+            assert items[0][1].shape == (2, 3)
+
+        keys = {key for key, _ in collection.iter_read()}
+        assert keys == {"file_a", "file_b"}
+
+    def should_stop_iterating_early(self, folder_collection):
+        datasets_path = Path(__file__).parent / "examples"
+        context = {"catalog_uri": datasets_path.absolute().as_uri()}
+
+        items = folder_collection(context).iter_read(["file_a", "file_b"])
+        key, _ = next(items)
+        items.close()
+        assert key == "file_a"
+
+    def should_read_feather_items(self, tmp_path):
+        class MyCollection(dc.FileCollection):
+            keys = lambda self: ["a", "b"]
+
+            class Item(dd.FeatherDataset):
+                pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        for key in ["a", "b"]:
+            MyCollection.get(key)(context).write(pd.DataFrame({"x": [key]}))
+
+        assert MyCollection.get("a").relative_path.suffix == ".feather"
+        all_dfs = MyCollection(context).read(columns=["x"])
+        assert all_dfs["b"]["x"].tolist() == ["b"]
+
+    def should_report_read_errors_by_key(self, folder_collection):
+        datasets_path = Path(__file__).parent / "examples"
+        context = {"catalog_uri": datasets_path.absolute().as_uri()}
+
+        with pytest.raises(dc.CollectionReadError) as error_info:
+            folder_collection(context).read(
+                ["file_a", "missing_1", "missing_2"], max_workers=2
+            )
+        assert set(error_info.value.errors) == {"missing_1", "missing_2"}
+        assert isinstance(
+            error_info.value.errors["missing_1"], FileNotFoundError
+        )
+
+
+class TestKeysCache:
+    @pytest.fixture
+    def counting_collection(self):
+        class CountingCollection(dc.AbstractCollection):
+            calls = []
+
+            def keys(self):
+                self.calls.append(1)
+                return ["a", "b"]
+
+            class Item(dd.AbstractDataset):
+                pass
+
+        return CountingCollection
+
+    def should_not_cache_keys_by_default(self, counting_collection):
+        counting_collection({}).keys()
+        counting_collection({}).keys()
+        assert len(counting_collection.calls) == 2
+
+    def should_cache_keys_within_block(self, counting_collection):
+        with dc.caching_keys():
+            assert counting_collection({}).keys() == ["a", "b"]
+            assert counting_collection({}).keys() == ["a", "b"]
+            assert len(counting_collection.calls) == 1
+
+            # Keys depend on the context
+            counting_collection({"a": 1}).keys()
+            assert len(counting_collection.calls) == 2
+
+        counting_collection({}).keys()
+        assert len(counting_collection.calls) == 3
+
+    def should_invalidate_keys(self, counting_collection):
+        cache = dc.KeysCache()
+        with dc.caching_keys(cache):
+            counting_collection({}).keys()
+            cache.invalidate(counting_collection)
+            counting_collection({}).keys()
+            assert len(counting_collection.calls) == 2
+
+            cache.invalidate()
+            counting_collection({}).keys()
+            assert len(counting_collection.calls) == 3
+
+    def should_expire_keys(self, counting_collection):
+        with dc.caching_keys(dc.KeysCache(ttl=0)):
+            counting_collection({}).keys()
+            counting_collection({}).keys()
+        assert len(counting_collection.calls) == 2
+
+    def should_scope_caches_to_their_thread(self, counting_collection):
+        in_block = threading.Event()
+        block_done = threading.Event()
+
+        def run_block():
+            with dc.caching_keys():
+                in_block.set()
+                block_done.wait()
+
+        thread = threading.Thread(target=run_block)
+        thread.start()
+        in_block.wait()
+        try:
+            # The block of the other thread does not cache keys here
+            counting_collection({}).keys()
+            counting_collection({}).keys()
+        finally:
+            block_done.set()
+            thread.join()
+        assert len(counting_collection.calls) == 2
+
+    def should_cache_keys_of_filtered_collections(self, tmp_path):
+        class MyCollection(dc.FileCollection):
+            keys = lambda self: ["a", "b"]
+
+            class Item(dd.FileDataset):
+                pass
+
+        calls = []
+
+        def key_filter(self, child_key):
+            calls.append(1)
+            return [child_key]
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        my_filter = dc.CollectionFilter(MyCollection, key_filter)
+        with dc.caching_keys():
+            my_filter.filter_by("a")(context).keys()
+            my_filter.filter_by("a")(context).keys()
+        assert len(calls) == 1
+
 
 @pytest.fixture
 def collection_to_filter():
@@ -370,6 +562,120 @@ class TestCollectionFilter:
         filtered_collection(context).keys()
 
 
+    def should_cache_filtered_collections(self, collection_to_filter):
+        def key_filter(self, child_key):
+            return [child_key + "1"]
+
+        my_filter = dc.CollectionFilter(collection_to_filter, key_filter)
+        filtered_a = my_filter.filter_by("a")
+        assert my_filter.filter_by("a") is filtered_a
+        assert my_filter.filter_by("b") is not filtered_a
+
+        # Another filter with the same key filter gives the same collection
+        other_filter = dc.CollectionFilter(collection_to_filter, key_filter)
+        assert other_filter.filter_by("a") is filtered_a
+
+    def should_give_stable_names_to_filtered_collections(
+        self, collection_to_filter
+    ):
+        def make_filter():
+            return dc.CollectionFilter(
+                collection_to_filter, lambda self, child_key: [child_key]
+            )
+
+        # Distinct key filter objects, defined by the same code
+        filtered_a = make_filter().filter_by("a")
+        filtered_b = make_filter().filter_by("a")
+        assert filtered_a.catalog_path() == filtered_b.catalog_path()
+        assert filtered_a == filtered_b
+        assert hash(filtered_a) == hash(filtered_b)
+        assert make_filter().filter_by("b") != filtered_a
+
+    def should_distinguish_key_filters_capturing_different_values(
+        self, collection_to_filter
+    ):
+        def make_filter(suffix):
+            return dc.CollectionFilter(
+                collection_to_filter,
+                lambda self, child_key: [child_key + suffix],
+            )
+
+        filtered_1 = make_filter("1").filter_by("a")
+        filtered_2 = make_filter("2").filter_by("a")
+        assert filtered_1.catalog_path() != filtered_2.catalog_path()
+        assert filtered_1 != filtered_2
+        assert make_filter("1").filter_by("a") == filtered_1
+
+        context = {"catalog_uri": "file:///tmp"}
+        with dc.caching_keys():
+            assert filtered_1(context).keys() == ["a1"]
+            assert filtered_2(context).keys() == ["a2"]
+
+    def should_distinguish_key_filters_defined_on_the_same_line(
+        self, collection_to_filter
+    ):
+        new, coll = dc.CollectionFilter, collection_to_filter
+        a, b = new(coll, lambda c, k: ["a1"]), new(coll, lambda c, k: ["b1"])
+        filtered_a = a.filter_by("a")
+        filtered_b = b.filter_by("a")
+        assert filtered_a.catalog_path() != filtered_b.catalog_path()
+        assert filtered_a != filtered_b
+
+        context = {"catalog_uri": "file:///tmp"}
+        assert filtered_a(context).keys() == ["a1"]
+        assert filtered_b(context).keys() == ["b1"]
+
+    def should_not_share_names_of_key_filters_capturing_objects(
+        self, collection_to_filter
+    ):
+        def make_filter(selected_keys):
+            return dc.CollectionFilter(
+                collection_to_filter,
+                lambda self, child_key: selected_keys.keys(),
+            )
+
+        class Keys:
+            def __init__(self, keys):
+                self._keys = keys
+
+            def keys(self):
+                return self._keys
+
+        filtered_1 = make_filter(Keys(["a1"])).filter_by("a")
+        filtered_2 = make_filter(Keys(["a2"])).filter_by("a")
+        assert filtered_1.catalog_path() != filtered_2.catalog_path()
+
+    def should_give_stable_names_to_key_filters_capturing_collections(
+        self, collection_to_filter
+    ):
+        def make_filter(collection):
+            return dc.CollectionFilter(
+                collection_to_filter,
+                lambda self, child_key: collection.keys(self),
+            )
+
+        filtered_a = make_filter(collection_to_filter).filter_by("a")
+        filtered_b = make_filter(collection_to_filter).filter_by("a")
+        assert filtered_a.catalog_path() == filtered_b.catalog_path()
+
+    def should_share_item_classes_with_original_collection(
+        self, collection_to_filter, filtered_collection
+    ):
+        assert filtered_collection.get("a1") is collection_to_filter.get("a1")
+
+    def should_pickle_items_first_created_by_filtered_collections(self):
+        my_filter = dc.CollectionFilter(
+            FileCollectionForPickleTest, lambda self, child_key: [child_key]
+        )
+        my_filter.filter_by("key_b").get("key_b")
+
+        context = {"catalog_uri": "file:///tmp"}
+        item = FileCollectionForPickleTest.get("key_b")(context)
+        pickled_item = pickle.loads(pickle.dumps(item))
+        assert pickled_item.catalog_path() == item.catalog_path()
+        assert pickled_item.key == "key_b"
+
+
 class TestSingleDatasetFilter:
     def should_return_single_dataset(self, collection_to_filter):
         my_filter = dc.SingleDatasetFilter(
@@ -1,10 +1,13 @@
 from pathlib import Path, PurePath
 from datetime import datetime
+import pickle
+import sys
 
 import pytest
 import pandas as pd
 
 import data_catalog.datasets as dd
+import data_catalog.file_systems as dfs
 
 
 class TestAbstractDataset:
@@ -28,6 +31,50 @@ class TestAbstractDataset:
 
         assert MyDataset.description() == "This is a docstring."
 
+    def should_check_parent_columns_match_parents(self):
+        class ParentDataset(dd.AbstractDataset):
+            pass
+
+        with pytest.raises(ValueError):
+
+            class ChildDataset(dd.AbstractDataset):
+                parents = [ParentDataset]
+                parent_columns = [["a"], ["b"]]
+
+                def create(self, df):
+                    pass
+
+    def should_check_create_chunks_matches_parents(self):
+        class ParentDataset(dd.AbstractDataset):
+            pass
+
+        with pytest.raises(ValueError):
+
+            class ChildDataset(dd.AbstractDataset):
+                parents = [ParentDataset]
+
+                def create_chunks(self):
+                    yield None
+
+    def should_not_define_both_create_methods(self):
+        with pytest.raises(ValueError):
+
+            class MyDataset(dd.AbstractDataset):
+                def create(self):
+                    pass
+
+                def create_chunks(self):
+                    yield None
+
+    def should_not_stream_ephemeral_datasets(self):
+        with pytest.raises(ValueError):
+
+            class MyDataset(dd.AbstractDataset):
+                ephemeral = True
+
+                def create_chunks(self):
+                    yield None
+
     def should_check_parents_are_datasets(self):
         with pytest.raises(ValueError):
 
@@ -237,6 +284,19 @@ class TestFileDataset:
         a = dd.FileDataset(context)
         assert a.context == context
 
+    def should_share_file_system_between_datasets(self, tmpdir):
+        context = {"catalog_uri": Path(tmpdir).absolute().as_uri()}
+        a = dd.FileDataset(context)
+        b = dd.CsvDataset(context)
+        assert a.file_system is b.file_system
+
+    def should_take_file_system_from_pool_when_unpickled(self, tmpdir):
+        context = {"catalog_uri": Path(tmpdir).absolute().as_uri()}
+        a = dd.FileDataset(context)
+        unpickled = pickle.loads(pickle.dumps(a))
+        assert unpickled.context == context
+        assert unpickled.file_system is a.file_system
+
 
 class TestCsvDataset:
     def should_write(self, tmpdir):
@@ -296,6 +356,324 @@ class TestCsvDataset:
         assert df.shape == (2, 2)
 
 
+class TestAtomicWrite:
+    def should_keep_previous_version_on_failed_write(self, tmp_path):
+        class RawDataset(dd.CsvDataset):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2]}))
+
+        def failing_chunks():
+            yield pd.DataFrame({"a": [3]})
+            raise RuntimeError()
+
+        with pytest.raises(RuntimeError):
+            a.write_chunks(failing_chunks())
+        assert a.read()["a"].tolist() == [1, 2]
+
+
+class TestParquetDataset:
+    def should_read_selected_columns_and_rows(self, tmp_path):
+        class RawDataset(dd.ParquetDataset):
+            relative_path = "raw/dataset.parquet"
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]}))
+
+        df = a.read(columns=["a"], filters=[("a", ">", 1)])
+        assert list(df.columns) == ["a"]
+        assert df["a"].tolist() == [2, 3]
+
+    def should_bypass_read_cache_with_kwargs(self, tmp_path):
+        class RawDataset(dd.ParquetDataset):
+            relative_path = "raw/dataset.parquet"
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_cache_bytes": 10 ** 6,
+        }
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2], "b": [3, 4]}))
+
+        assert list(a.read().columns) == ["a", "b"]
+        assert list(a.read(columns=["b"]).columns) == ["b"]
+
+
+class TestFeatherDataset:
+    @pytest.mark.parametrize("compression", ["uncompressed", "lz4", "zstd"])
+    def should_write_and_read(self, tmp_path, compression):
+        class RawDataset(dd.FeatherDataset):
+            write_kwargs = {"compression": compression}
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}, index=[3, 4])
+        a.write(df)
+        assert a.path().suffix == ".feather"
+        assert a.read().equals(df)
+        assert list(a.read(columns=["b"]).columns) == ["b"]
+
+
+class TestPickleDataset:
+    @pytest.mark.parametrize("read_memory_map", [True, False])
+    def should_save_buffers_out_of_band(self, tmp_path, read_memory_map):
+        class RawDataset(dd.PickleDataset):
+            pass
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_memory_map": read_memory_map,
+        }
+        a = RawDataset(context)
+        df = pd.DataFrame({"a": range(1000), "b": 0.5, "c": "x"})
+        a.write(df)
+        with open(a.path(), "rb") as file:
+            assert file.read(10) == b"DCPICKLE5\n"
+
+        df_read = a.read()
+        assert df_read.equals(df)
+        # Arrays can be modified in place
+        df_read.iloc[0, 0] = -1
+        assert df_read.iloc[0, 0] == -1
+
+    def should_read_buffers_without_copy(self, tmp_path):
+        class RawDataset(dd.PickleDataset):
+            read_kwargs = {"copy_buffers": False}
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        df = pd.DataFrame({"a": range(1000)})
+        a.write(df)
+        df_read = a.read()
+        assert df_read.equals(df)
+        assert not df_read["a"].to_numpy().flags.writeable
+
+    def should_read_legacy_pickle_files(self, tmp_path):
+        class RawDataset(dd.PickleDataset):
+            write_kwargs = {"protocol": 4}
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        df = pd.DataFrame({"a": [1, 2]})
+        a.write(df)
+        assert a.read().equals(df)
+
+        with open(a.path(), "rb") as file:
+            assert pickle.load(file).equals(df)
+
+
+class TestMemoryMap:
+    @pytest.mark.parametrize(
+        "dataset_class",
+        [dd.ParquetDataset, dd.FeatherDataset, dd.PickleDataset],
+    )
+    def should_read_local_files_through_memory_maps(
+        self, tmp_path, mocker, dataset_class
+    ):
+        class RawDataset(dataset_class):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        df = pd.DataFrame({"a": [1, 2]})
+        a.write(df)
+
+        open_memory_map = mocker.spy(a.file_system, "open_memory_map")
+        assert a.read().equals(df)
+        assert open_memory_map.call_count == 1
+
+    def should_let_context_disable_memory_maps(self, tmp_path, mocker):
+        class RawDataset(dd.ParquetDataset):
+            pass
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_memory_map": False,
+        }
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2]}))
+
+        open_memory_map = mocker.spy(a.file_system, "open_memory_map")
+        assert a.read()["a"].tolist() == [1, 2]
+        assert open_memory_map.call_count == 0
+
+    def should_read_pickle_files_without_pyarrow(
+        self, tmp_path, mocker, monkeypatch
+    ):
+        class RawDataset(dd.PickleDataset):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        # Without string labels, which pandas may store with pyarrow
+        df = pd.DataFrame([[1], [2]])
+        a.write(df)
+
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+        dfs._pyarrow_available.cache_clear()
+        try:
+            open_memory_map = mocker.spy(a.file_system, "open_memory_map")
+            assert a.read().equals(df)
+            assert open_memory_map.call_count == 0
+        finally:
+            dfs._pyarrow_available.cache_clear()
+
+
+class TestChunks:
+    @pytest.mark.parametrize(
+        "dataset_class",
+        [dd.CsvDataset, dd.ParquetDataset, dd.FeatherDataset],
+    )
+    def should_write_and_read_chunks(self, tmp_path, dataset_class):
+        class RawDataset(dataset_class):
+            write_kwargs = {"index": False}
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write_chunks(
+            pd.DataFrame({"a": [i, i + 1], "b": [0, 0]}) for i in (0, 2, 4)
+        )
+
+        chunks = list(a.read_chunks(chunksize=4))
+        assert [len(chunk) for chunk in chunks] == [4, 2]
+        df = pd.concat(chunks)
+        assert df["a"].tolist() == [0, 1, 2, 3, 4, 5]
+        assert a.read()["a"].tolist() == [0, 1, 2, 3, 4, 5]
+
+    @pytest.mark.parametrize(
+        "dataset_class",
+        [dd.CsvDataset, dd.ParquetDataset, dd.FeatherDataset],
+    )
+    def should_not_write_files_without_chunks(self, tmp_path, dataset_class):
+        class RawDataset(dataset_class):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        with pytest.raises(ValueError):
+            a.write_chunks(iter([]))
+        assert not a.exists()
+
+        # A previous version of the dataset is left untouched
+        a.write(pd.DataFrame({"a": [1, 2]}))
+        with pytest.raises(ValueError):
+            a.write_chunks(iter([]))
+        assert a.read()["a"].tolist() == [1, 2]
+
+    def should_take_chunksize_from_context(self, tmp_path):
+        class RawDataset(dd.ParquetDataset):
+            pass
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_chunksize": 1,
+        }
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]}))
+        chunks = list(a.read_chunks(columns=["b"]))
+        assert len(chunks) == 3
+        assert list(chunks[0].columns) == ["b"]
+
+    def should_filter_rows_of_parquet_chunks(self, tmp_path):
+        class RawDataset(dd.ParquetDataset):
+            read_kwargs = {"filters": [("a", ">", 1)]}
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]}))
+
+        chunks = list(a.read_chunks(chunksize=2, columns=["b"]))
+        df = pd.concat(chunks, ignore_index=True)
+        assert df.equals(a.read(columns=["b"]).reset_index(drop=True))
+        assert df["b"].tolist() == [5, 6]
+
+    def should_reject_unsupported_chunk_read_arguments(self, tmp_path):
+        class RawDataset(dd.ParquetDataset):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2, 3]}))
+        with pytest.raises(ValueError):
+            list(a.read_chunks(dtype_backend="pyarrow"))
+
+    def should_reject_unsupported_feather_chunk_read_arguments(self, tmp_path):
+        class RawDataset(dd.FeatherDataset):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]}))
+        chunks = list(a.read_chunks(columns=["b"], memory_map=True))
+        assert [list(chunk.columns) for chunk in chunks] == [["b"]]
+        with pytest.raises(ValueError):
+            list(a.read_chunks(use_threads=False))
+
+    def should_tell_chunks_are_unsupported(self, tmp_path):
+        class RawDataset(dd.PickleDataset):
+            pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1]}))
+        with pytest.raises(NotImplementedError):
+            list(a.read_chunks())
+
+
+class TestReadCache:
+    def should_reuse_data_read_from_storage(self, tmp_path, mocker):
+        class RawDataset(dd.CsvDataset):
+            relative_path = "raw/dataset.csv"
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_cache_bytes": 10 ** 6,
+        }
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2]}))
+
+        read = mocker.spy(RawDataset, "_read")
+        df_1 = a.read()
+        df_2 = RawDataset(context).read()
+        assert df_2.equals(df_1)
+        assert read.call_count == 1
+
+        # Writing invalidates cached data
+        a.write(pd.DataFrame({"a": [3, 4]}))
+        assert a.read()["a"].tolist() == [3, 4]
+        assert read.call_count == 2
+
+    def should_isolate_readers_from_each_other(self, tmp_path):
+        class RawDataset(dd.CsvDataset):
+            relative_path = "raw/dataset.csv"
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_cache_bytes": 10 ** 6,
+        }
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2]}))
+
+        df_1 = a.read()
+        df_1["b"] = 0
+        df_1.loc[0, "a"] = 10
+        df_2 = a.read()
+        assert "b" not in df_2.columns
+        assert df_2["a"].tolist() == [1, 2]
+
+    def should_not_cache_data_by_default(self, tmp_path):
+        class RawDataset(dd.CsvDataset):
+            relative_path = "raw/dataset.csv"
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a = RawDataset(context)
+        a.write(pd.DataFrame({"a": [1, 2]}))
+        assert a.read() is not a.read()
+
+
 class TestYamlDataset:
     def should_read_and_write(self, tmp_path):
         context = {"catalog_uri": tmp_path.absolute().as_uri()}
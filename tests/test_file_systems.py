@@ -1,5 +1,7 @@
+import asyncio
 from pathlib import Path, PurePosixPath
-from datetime import datetime
+from datetime import datetime, timezone
+import pickle
 
 import pytest
 
@@ -7,6 +9,8 @@ from data_catalog.file_systems import (
     LocalFileSystem,
     S3FileSystem,
     create_filesystem_from_uri,
+    get_filesystem_from_uri,
+    _reset_file_system_pool,
 )
 
 
@@ -37,6 +41,114 @@ class TestLocalFileSystem:
             contents = file.read()
         assert contents[0] == "a"
 
+    def should_open_memory_maps(self, local_file_system):
+        assert local_file_system.supports_memory_map
+        with local_file_system.open_memory_map("raw_dataset.csv") as file:
+            contents = file.read()
+        assert contents[:1] == b"a"
+
+    def should_fingerprint_file_contents(self, tmpdir):
+        fs = LocalFileSystem(tmpdir)
+        with fs.open("file.txt", "w") as file:
+            file.write("aaa")
+        fingerprint = fs.fingerprint("file.txt")
+        assert fingerprint.startswith("3-")
+
+        with fs.open("file.txt", "w") as file:
+            file.write("aaa")
+        assert fs.fingerprint("file.txt") == fingerprint
+
+        with fs.open("file.txt", "w") as file:
+            file.write("aab")
+        assert fs.fingerprint("file.txt") != fingerprint
+
+    def should_replace_files_atomically(self, tmpdir):
+        fs = LocalFileSystem(tmpdir)
+        with fs.open_atomic("mytest_dir/file.txt") as file:
+            file.write("aaa")
+            assert not fs.exists("mytest_dir/file.txt")
+
+        with pytest.raises(RuntimeError):
+            with fs.open_atomic("mytest_dir/file.txt") as file:
+                file.write("bbb")
+                raise RuntimeError()
+
+        with fs.open("mytest_dir/file.txt") as file:
+            assert file.read() == "aaa"
+        assert fs.listdir("mytest_dir", with_hidden_files=True) == [
+            "file.txt"
+        ]
+
+    def should_not_create_directories_when_reading(self, tmpdir):
+        fs = LocalFileSystem(tmpdir)
+        with pytest.raises(FileNotFoundError):
+            fs.open("mytest_dir/file.txt")
+        assert not fs.exists("mytest_dir")
+
+    def should_create_known_directories_once(self, tmpdir, mocker):
+        fs = LocalFileSystem(tmpdir)
+        mkdir = mocker.spy(fs, "mkdir")
+        for name in ["a.txt", "b.txt"]:
+            with fs.open(f"mytest_dir/{name}", "w") as file:
+                file.write("aaa")
+        assert mkdir.call_count == 1
+
+        # A directory removed since is created again
+        for name in ["a.txt", "b.txt"]:
+            (fs.root / "mytest_dir" / name).unlink()
+        (fs.root / "mytest_dir").rmdir()
+        with fs.open("mytest_dir/a.txt", "w") as file:
+            file.write("aaa")
+        assert fs.exists("mytest_dir/a.txt")
+
+    def should_make_directories_in_bulk(self, tmpdir, mocker):
+        fs = LocalFileSystem(tmpdir)
+        fs.mkdirs(["a/b", "a/c", "a", "d"])
+        for path in ["a/b", "a/c", "d"]:
+            assert fs.exists(path)
+
+        mkdir = mocker.spy(fs, "mkdir")
+        fs.mkdirs(["a", "a/b"])
+        with fs.open("a/c/file.txt", "w") as file:
+            file.write("aaa")
+        assert mkdir.call_count == 0
+
+    def should_be_picklable(self, tmpdir):
+        fs = LocalFileSystem(tmpdir)
+        fs.mkdir("mytest_dir")
+
+        unpickled = pickle.loads(pickle.dumps(fs))
+        assert unpickled.root == fs.root
+        assert unpickled._known_directories == set()
+        with unpickled.open("other_dir/file.txt", "w") as file:
+            file.write("aaa")
+        assert unpickled.exists("other_dir/file.txt")
+
+    def should_get_file_metadata(self, local_file_system):
+        info = local_file_system.info("raw_dataset.csv")
+        assert info["size"] > 0
+        assert isinstance(info["last_update_time"], datetime)
+
+        infos = local_file_system.info_many(
+            ["raw_dataset.csv", "not_existing_dataset.csv"]
+        )
+        assert infos["raw_dataset.csv"] == info
+        assert infos["not_existing_dataset.csv"] is None
+
+    def should_provide_async_methods(self, local_file_system):
+        async def main():
+            exists = await local_file_system.async_exists("raw_dataset.csv")
+            info = await local_file_system.async_info("raw_dataset.csv")
+            file = await local_file_system.async_open("raw_dataset.csv")
+            with file:
+                contents = file.read()
+            return exists, info, contents
+
+        exists, info, contents = asyncio.run(main())
+        assert exists
+        assert info == local_file_system.info("raw_dataset.csv")
+        assert contents[0] == "a"
+
     def should_make_directories(self, tmpdir):
         fs = LocalFileSystem(tmpdir)
         fs.mkdir("mytest")
@@ -60,6 +172,17 @@ class TestLocalFileSystem:
         expected_filenames = {"file_a.dat", "file_b.dat", ".hidden_file.dat"}
         assert set(filenames) == expected_filenames
 
+    def should_list_files_with_details(self, local_file_system):
+        details = local_file_system.listdir_details("dir_to_list")
+        expected_filenames = {"file_a.dat", "file_b.dat", ".hidden_file.dat"}
+        assert set(details) == expected_filenames
+        assert details["file_a.dat"][
+            "last_update_time"
+        ] == local_file_system.last_update_time("dir_to_list/file_a.dat")
+        assert isinstance(details["file_a.dat"]["size"], int)
+
+        assert local_file_system.listdir_details("not_existing_dir") == {}
+
 
 @pytest.fixture
 def s3_file_system():
@@ -75,6 +198,66 @@ class TestS3FileSystem:
         uri = s3_file_system.uri("raw_dataset.csv")
         assert uri == "s3://my-bucket/data/catalog/raw_dataset.csv"
 
+    def should_upload_files_once_written(self, mocker):
+        fs = S3FileSystem(
+            "my-bucket/data/catalog",
+            upload_part_size=2 ** 23,
+            upload_max_concurrency=4,
+        )
+        put_file = mocker.patch.object(fs.file_system, "put_file")
+
+        with fs.open_atomic("dataset.csv") as file:
+            file.write("aaa")
+            assert not put_file.called
+        temp_path = put_file.call_args[0][0]
+        put_file.assert_called_once_with(
+            temp_path,
+            "my-bucket/data/catalog/dataset.csv",
+            chunksize=2 ** 23,
+            max_concurrency=4,
+        )
+        assert not Path(temp_path).exists()
+
+    def should_reject_upload_concurrency_unsupported_by_s3fs(self, mocker):
+        async def put_file(self, lpath, rpath, chunksize=2 ** 20, **kwargs):
+            pass
+
+        mocker.patch("s3fs.S3FileSystem._put_file", put_file)
+        with pytest.raises(ValueError):
+            S3FileSystem("my-bucket/data/catalog", upload_max_concurrency=4)
+        S3FileSystem("my-bucket/data/catalog", upload_part_size=2 ** 23)
+
+    def should_get_metadata_of_many_files(self, s3_file_system, mocker):
+        last_modified = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+        async def info(path):
+            if path.endswith("missing.csv"):
+                raise FileNotFoundError(path)
+            return {
+                "name": path,
+                "type": "file",
+                "size": 3,
+                "LastModified": last_modified,
+            }
+
+        mocker.patch.object(s3_file_system.file_system, "_info", info)
+
+        infos = s3_file_system.info_many(["a.csv", "missing.csv"])
+        assert infos == {
+            "a.csv": {"last_update_time": last_modified, "size": 3},
+            "missing.csv": None,
+        }
+        info = asyncio.run(s3_file_system.async_info("a.csv"))
+        assert info == infos["a.csv"]
+
+    def should_not_upload_partial_files(self, s3_file_system, mocker):
+        put_file = mocker.patch.object(s3_file_system.file_system, "put_file")
+        with pytest.raises(RuntimeError):
+            with s3_file_system.open_atomic("dataset.csv") as file:
+                file.write("aaa")
+                raise RuntimeError()
+        assert not put_file.called
+
 
 class TestCreateFilesystemFromUri:
     def should_infer_correct_filesystem(self):
@@ -85,3 +268,30 @@ class TestCreateFilesystemFromUri:
         fs_b = create_filesystem_from_uri("s3://some/s3/path")
         assert isinstance(fs_b, S3FileSystem)
         assert str(fs_b.root) == "some/s3/path"
+
+
+class TestGetFilesystemFromUri:
+    def should_share_file_systems(self):
+        file_uri = PurePosixPath("/tmp/some/path").as_uri()
+        fs_a = get_filesystem_from_uri(file_uri)
+        fs_b = get_filesystem_from_uri(file_uri)
+        assert fs_a is fs_b
+
+        fs_c = get_filesystem_from_uri(PurePosixPath("/tmp/other").as_uri())
+        assert fs_c is not fs_a
+
+    def should_distinguish_keyword_arguments(self):
+        fs_a = get_filesystem_from_uri("s3://some/s3/path", anon=True)
+        fs_b = get_filesystem_from_uri("s3://some/s3/path", anon=False)
+        fs_c = get_filesystem_from_uri(
+            "s3://some/s3/path", anon=True, client_kwargs={"region_name": "a"}
+        )
+        assert fs_a is not fs_b
+        assert fs_a is not fs_c
+        assert fs_a is get_filesystem_from_uri("s3://some/s3/path", anon=True)
+
+    def should_empty_pool_after_reset(self):
+        file_uri = PurePosixPath("/tmp/some/path").as_uri()
+        fs_a = get_filesystem_from_uri(file_uri)
+        _reset_file_system_pool()
+        assert get_filesystem_from_uri(file_uri) is not fs_a
@@ -0,0 +1,202 @@
+from pathlib import PurePath
+
+import pytest
+import pandas as pd
+
+import data_catalog.collections as dc
+import data_catalog.datasets as dd
+import data_catalog.manifests as dm
+
+
+@pytest.fixture
+def sample_datasets():
+    class ParentDataset(dd.CsvDataset):
+        relative_path = "parent.csv"
+
+    class ChildDataset(dd.CsvDataset):
+        relative_path = "child/dataset.csv"
+        parents = [ParentDataset]
+
+        def create(self, df):
+            return df
+
+    return ParentDataset, ChildDataset
+
+
+def first_keys(keys):
+    """Select keys in a key filter, captured by value in a test.
+    """
+    return sorted(keys)[:1]
+
+
+class TestManifestPath:
+    def should_be_hidden_file_next_to_dataset(self, sample_datasets):
+        _, child = sample_datasets
+        path = dm.manifest_path(child)
+        assert path.parent == PurePath("child")
+        assert path.name.startswith(".dataset.csv")
+
+
+class TestWriteManifest:
+    def should_record_fingerprints(self, sample_datasets, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        parent, child = [d(context) for d in sample_datasets]
+        parent.write(pd.DataFrame({"a": [1, 2]}))
+        child.write(pd.DataFrame({"a": [1, 2]}))
+
+        assert dm.read_manifest(child) is None
+        dm.write_manifest(child, [parent])
+
+        manifest = dm.read_manifest(child)
+        assert manifest["fingerprint"] == child.fingerprint()
+        assert manifest["inputs"] == {
+            parent.catalog_path(): parent.fingerprint()
+        }
+
+
+class TestInputsChanged:
+    def should_detect_changed_inputs(self, sample_datasets, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        parent, child = [d(context) for d in sample_datasets]
+        parent.write(pd.DataFrame({"a": [1, 2]}))
+        child.write(pd.DataFrame({"a": [1, 2]}))
+
+        assert dm.inputs_changed(dm.read_manifest(child), [parent]) is None
+
+        dm.write_manifest(child, [parent])
+        manifest = dm.read_manifest(child)
+        assert not dm.inputs_changed(manifest, [parent])
+
+        # Same contents
+        parent.write(pd.DataFrame({"a": [1, 2]}))
+        assert not dm.inputs_changed(manifest, [parent])
+
+        # Changed contents
+        parent.write(pd.DataFrame({"a": [1, 3]}))
+        assert dm.inputs_changed(manifest, [parent])
+
+
+class TestFingerprint:
+    def should_combine_fingerprints_of_collection_items(self, tmp_path):
+        class MyCollection(dc.FileCollection):
+            keys = lambda self: ["a", "b"]
+
+            class Item(dd.CsvDataset):
+                pass
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        for key in ["a", "b"]:
+            MyCollection.get(key)(context).write(pd.DataFrame({key: [1]}))
+
+        cache = {}
+        fingerprint = dm.fingerprint(MyCollection(context), cache=cache)
+        assert isinstance(fingerprint, str)
+        assert MyCollection.get("a")(context) in cache
+
+        MyCollection.get("a")(context).write(pd.DataFrame({"a": [2]}))
+        assert dm.fingerprint(MyCollection(context)) != fingerprint
+
+
+class TestCodeHash:
+    def should_change_with_code(self, sample_datasets):
+        parent, child = sample_datasets
+
+        class SameChild(dd.CsvDataset):
+            relative_path = "child/dataset.csv"
+            parents = [parent]
+
+            def create(self, df):
+                return df
+
+        class OtherCode(dd.CsvDataset):
+            parents = [parent]
+
+            def create(self, df):
+                return 2 * df
+
+        class OtherKwargs(dd.CsvDataset):
+            parents = [parent]
+            write_kwargs = {"index": False}
+
+            def create(self, df):
+                return df
+
+        class OtherParents(dd.CsvDataset):
+            parents = [child]
+
+            def create(self, df):
+                return df
+
+        assert dm.code_hash(SameChild) == dm.code_hash(child)
+        for other in [OtherCode, OtherKwargs, OtherParents]:
+            assert dm.code_hash(other) != dm.code_hash(child)
+
+    def should_not_change_with_key_filters_capturing_functions(self):
+        class Collection1(dc.FileCollection):
+            def keys(self):
+                return ["a1", "a2"]
+
+            class Item(dd.CsvDataset):
+                pass
+
+        def make_child_collection():
+            def select_with(select):
+                return dc.CollectionFilter(
+                    Collection1, lambda self, child_key: select(self.keys())
+                )
+
+            class Collection2(dc.FileCollection):
+                def keys(self):
+                    return ["a"]
+
+                class Item(dd.CsvDataset):
+                    parents = [select_with(first_keys)]
+
+                    def create(self, collection):
+                        return collection
+
+            return Collection2
+
+        # Built twice, as in two processes
+        child_1 = make_child_collection().get("a")
+        child_2 = make_child_collection().get("a")
+        assert dm.code_hash(child_1) == dm.code_hash(child_2)
+
+    def should_detect_changed_code(self, sample_datasets, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        parent, child = [d(context) for d in sample_datasets]
+        parent.write(pd.DataFrame({"a": [1, 2]}))
+        child.write(pd.DataFrame({"a": [1, 2]}))
+
+        assert dm.code_changed(None, child) is None
+        dm.write_manifest(child, [parent])
+        manifest = dm.read_manifest(child)
+        assert not dm.code_changed(manifest, child)
+
+        manifest["code_hash"] = "other"
+        assert dm.code_changed(manifest, child)
+
+
+class TestCatalogManifest:
+    def should_save_and_load_entries(self, sample_datasets, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        parent, child = [d(context) for d in sample_datasets]
+        parent.write(pd.DataFrame({"a": [1, 2]}))
+
+        catalog_manifest = dm.CatalogManifest.load(parent.file_system)
+        assert parent not in catalog_manifest
+
+        catalog_manifest.record(
+            parent, parent.last_update_time(), size=10, manifest={"a": 1}
+        )
+        catalog_manifest.save()
+
+        loaded = dm.CatalogManifest.load(parent.file_system)
+        assert parent in loaded
+        assert child not in loaded
+        assert loaded.last_update_time(parent) == parent.last_update_time()
+        assert loaded.size(parent) == 10
+        assert loaded.manifest(parent) == {"a": 1}
+
+        loaded.discard(parent)
+        assert parent not in loaded
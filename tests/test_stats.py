@@ -0,0 +1,173 @@
+import pytest
+import pandas as pd
+import dask
+
+import data_catalog.datasets as dd
+import data_catalog.stats as ds
+import data_catalog.taskgraph as dt
+from data_catalog.file_systems import LocalFileSystem
+
+
+@pytest.fixture
+def chain_data_classes():
+    """A chain of three datasets, and a single independent dataset.
+    """
+    created = []
+
+    class A1(dd.ParquetDataset):
+        def create(self):
+            created.append("A1")
+            return pd.DataFrame({"a": [1]})
+
+    class A2(dd.ParquetDataset):
+        parents = [A1]
+
+        def create(self, df):
+            created.append("A2")
+            return df
+
+    class A3(dd.ParquetDataset):
+        parents = [A2]
+
+        def create(self, df):
+            created.append("A3")
+            return df
+
+    class B1(dd.ParquetDataset):
+        def create(self):
+            created.append("B1")
+            return pd.DataFrame({"b": [1]})
+
+    return {"A1": A1, "A2": A2, "A3": A3, "B1": B1}, created
+
+
+class TestTaskStats:
+    def should_save_and_load_entries(self, chain_data_classes, tmp_path):
+        data_classes, _ = chain_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        a1, a2 = data_classes["A1"](context), data_classes["A2"](context)
+
+        task_stats = ds.TaskStats.from_context(context)
+        assert a1 not in task_stats
+
+        task_stats.record(a1, 2.5, memory_size=100, file_size=10)
+        task_stats.record(a1, 1.5)
+        task_stats.save()
+
+        loaded = ds.TaskStats.load(LocalFileSystem(tmp_path))
+        assert a1 in loaded
+        assert a2 not in loaded
+        assert loaded.duration(a1) == 1.5
+        assert loaded.memory_size(a1) == 100
+        assert loaded.file_size(a1) == 10
+        assert loaded.duration(a2) is None
+
+
+class TestCriticalPath:
+    def should_compute_critical_path_lengths(self):
+        task_graph = {
+            "a": (sum, []),
+            "b": (sum, ["a"]),
+            "c": (sum, ["a"]),
+            "d": (sum, ["b", "c"]),
+        }
+        durations = {"a": 1.0, "b": 5.0, "c": 2.0, "d": 1.0}
+        lengths = ds.critical_path_lengths(task_graph, durations)
+        assert lengths == {"a": 7.0, "b": 6.0, "c": 3.0, "d": 1.0}
+
+    def should_simulate_makespan(self):
+        task_graph = {
+            "a": (sum, []),
+            "b": (sum, ["a"]),
+            "c": (sum, []),
+            "d": (sum, []),
+            "e": (sum, []),
+        }
+        durations = {"a": 2.0, "b": 2.0, "c": 1.0, "d": 1.0, "e": 1.0}
+        priorities = ds.critical_path_lengths(task_graph, durations)
+        assert ds.simulate_makespan(task_graph, durations, priorities, 1) == 7
+        assert ds.simulate_makespan(task_graph, durations, priorities, 2) == 4
+
+        # Starting short tasks first delays the long chain
+        priorities = {"c": 10.0, "d": 10.0, "e": 10.0}
+        assert ds.simulate_makespan(task_graph, durations, priorities, 2) == 5
+
+    def should_estimate_durations_from_stats(
+        self, chain_data_classes, tmp_path
+    ):
+        data_classes, _ = chain_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, _ = dt.create_task_graph(data_classes.values(), context)
+        task_stats = ds.TaskStats.from_context(context)
+        task_stats.record(data_classes["A1"](context), 3.0)
+        task_stats.record(data_classes["B1"](context), 1.0)
+
+        durations = ds.task_durations(task_graph, task_stats)
+        assert {key.name(): value for key, value in durations.items()} == {
+            "A1": 3.0,
+            "A2": 2.0,  # Mean of recorded durations
+            "A3": 2.0,
+            "B1": 1.0,
+        }
+
+
+class TestCriticalPathScheduling:
+    @pytest.mark.parametrize(
+        "b1_duration, first_created", [(10.0, "B1"), (0.1, "A1")]
+    )
+    def should_start_longest_chains_first(
+        self, chain_data_classes, tmp_path, b1_duration, first_created
+    ):
+        data_classes, created = chain_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_stats = ds.TaskStats.from_context(context)
+        for name in ["A1", "A2", "A3"]:
+            task_stats.record(data_classes[name](context), 1.0)
+        task_stats.record(data_classes["B1"](context), b1_duration)
+
+        task_graph, targets = dt.create_task_graph(
+            data_classes.values(), context
+        )
+        with ds.CriticalPathScheduling(task_stats, num_workers=1):
+            dask.get(task_graph, targets)
+        assert created[0] == first_created
+
+    def should_insert_new_ready_tasks_by_priority(self):
+        scheduling = ds.CriticalPathScheduling(ds.TaskStats(None))
+        scheduling.priorities = {"a": 1.0, "b": 3.0, "c": 5.0, "d": 4.0}
+        state = {
+            # Sorted ready tasks, followed by the dependents of "done"
+            "ready": ["a", "b", "c", "e", "d"],
+            "dependents": {"done": {"d", "e", "f"}},
+            "waiting": {"f": {"other"}},
+        }
+        scheduling._insert_ready("done", state)
+        assert state["ready"] == ["e", "a", "b", "d", "c"]
+
+    def should_record_stats_and_report_makespan(
+        self, chain_data_classes, tmp_path
+    ):
+        data_classes, _ = chain_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_stats = ds.TaskStats.from_context(context)
+        task_graph, targets = dt.create_task_graph(
+            data_classes.values(), context, in_memory_data_transfer=True
+        )
+        scheduling = ds.CriticalPathScheduling(task_stats, num_workers=2)
+        assert scheduling.report() is None
+        with scheduling:
+            dask.get(task_graph, targets)
+
+        loaded = ds.TaskStats.from_context(context)
+        for data_class in data_classes.values():
+            dataset = data_class(context)
+            assert loaded.duration(dataset) >= 0
+            assert loaded.memory_size(dataset) > 0
+            assert loaded.file_size(dataset) == dataset.path().stat().st_size
+
+        report = scheduling.report()
+        # Without records, each task is predicted to last 1 second
+        assert report.predicted == 3.0
+        assert report.critical_path == 3.0
+        assert report.actual > 0
+        assert "Predicted makespan" in str(report)
@@ -1,4 +1,6 @@
 from pathlib import Path, PurePath
+import json
+import os
 
 import pytest
 import pandas as pd
@@ -7,7 +9,10 @@ import dask
 import data_catalog.datasets as dd
 import data_catalog.collections as dc
 import data_catalog.taskgraph as dt
+import data_catalog.manifests as dm
+import data_catalog.stats as ds
 from data_catalog.abc import is_collection
+from data_catalog.file_systems import LocalFileSystem
 
 
 @pytest.fixture
@@ -201,3 +206,893 @@ class TestCreateDatasets:
         )
         assert len(results) == 1
         assert set(results[0].columns) == {"a1"}
+
+
+class TestBackwardGraphBuild:
+    @pytest.mark.parametrize(
+        "target", ["Collection2", "Collection3", "Dataset1", "Dataset2"]
+    )
+    def should_build_same_graph_as_full_expansion(
+        self, sample_data_classes, tmp_path, target
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = sample_data_classes.values()
+        targets = list(
+            dt._get_dataset_instances([sample_data_classes[target]], context)
+        )
+
+        all_datasets = dt._get_dataset_instances(data_classes, context)
+        full_graph = dt._prune_task_graph(
+            dt._create_task_graph(all_datasets, context), targets
+        )
+        graph = dt._create_task_graph(
+            targets,
+            context,
+            is_in_catalog=dt._catalog_membership(data_classes, context),
+        )
+
+        assert graph.keys() == full_graph.keys()
+        for key, (_, parents) in graph.items():
+            assert parents == full_graph[key][1]
+
+    def should_not_expand_unreachable_collections(
+        self, sample_data_classes, tmp_path
+    ):
+        listed_collections = []
+
+        class UnreachableCollection(dc.FileCollection):
+            def keys(self):
+                listed_collections.append(self)
+                return ["a"]
+
+            class Item(dd.ParquetDataset):
+                def create(self):
+                    return pd.DataFrame()
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, _ = dt.create_task_graph(
+            [*sample_data_classes.values(), UnreachableCollection],
+            context,
+            targets=[sample_data_classes["Dataset1"]],
+        )
+        assert not listed_collections
+        assert {d.name() for d in task_graph} == {
+            "Dataset1",
+            "Collection1",
+            "Collection1:a1",
+            "Collection1:a2",
+            "Collection1:b1",
+            "Collection1:b2",
+        }
+
+    def should_leave_ancestors_outside_of_catalog_out(self, tmp_path):
+        class Dataset1(dd.ParquetDataset):
+            def create(self):
+                return pd.DataFrame({"a": [1]})
+
+        class Dataset2(dd.ParquetDataset):
+            parents = [Dataset1]
+
+            def create(self, df):
+                return df
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, _ = dt.create_task_graph([Dataset2], context)
+        assert list(task_graph) == [Dataset2]
+
+
+class TestStorageSnapshot:
+    def should_list_each_folder_once(
+        self, sample_data_classes, tmp_path, mocker
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(*dt.create_task_graph(sample_data_classes.values(), context))
+
+        datasets = dt._get_dataset_instances(
+            sample_data_classes.values(), context
+        )
+        listdir_details = mocker.spy(LocalFileSystem, "listdir_details")
+        exists = mocker.spy(dd.FileDataset, "exists")
+        snapshot = dt._take_storage_snapshot(datasets)
+
+        # One listing for the catalog root, and one for each non-empty
+        # collection folder
+        assert listdir_details.call_count == 4
+        assert exists.call_count == 0
+        assert set(snapshot) == datasets
+        for dataset, update_time in snapshot.items():
+            assert update_time == dataset.last_update_time()
+
+    def should_look_up_datasets_alone_in_their_folder_together(
+        self, tmp_path, mocker
+    ):
+        class Dataset1(dd.ParquetDataset):
+            relative_path = "folder_1/dataset_1.parquet"
+
+        class Dataset2(dd.ParquetDataset):
+            relative_path = "folder_2/dataset_2.parquet"
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        Dataset1(context).write(pd.DataFrame({"a": [1]}))
+
+        info_many = mocker.spy(LocalFileSystem, "info_many")
+        listdir_details = mocker.spy(LocalFileSystem, "listdir_details")
+        snapshot = dt._take_storage_snapshot(
+            [Dataset1(context), Dataset2(context)]
+        )
+        assert info_many.call_count == 1
+        assert listdir_details.call_count == 0
+        assert snapshot[Dataset1] == Dataset1(context).last_update_time()
+        assert snapshot[Dataset2] is None
+
+    def should_mark_missing_datasets(self, sample_data_classes, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        datasets = dt._get_dataset_instances(
+            sample_data_classes.values(), context
+        )
+        snapshot = dt._take_storage_snapshot(datasets)
+        assert all(t is None for t in snapshot.values())
+
+
+class TestDirectories:
+    def should_create_directories_when_running_tasks(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, targets = dt.create_task_graph(
+            sample_data_classes.values(), context
+        )
+        names = ["Collection1", "Collection2", "Collection3"]
+        for name in names:
+            relative_path = sample_data_classes[name].relative_path
+            assert not (tmp_path / relative_path).exists()
+
+        dask.get(task_graph, targets)
+        for name in names:
+            relative_path = sample_data_classes[name].relative_path
+            assert (tmp_path / relative_path).is_dir()
+
+    def should_create_directories_of_collections_at_once(
+        self, sample_data_classes, tmp_path, mocker
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, targets = dt.create_task_graph(
+            sample_data_classes.values(), context
+        )
+        file_system = sample_data_classes["Collection1"].get("a1")(
+            context
+        ).file_system
+        mkdirs = mocker.spy(file_system, "mkdirs")
+        mkdir = mocker.spy(file_system, "mkdir")
+        dask.get(task_graph, targets)
+
+        # One call per collection, and one folder each, not one per item
+        assert mkdirs.call_count == 3
+        assert mkdir.call_count == 3
+
+
+class TestKeysListing:
+    def should_list_collection_keys_once(self, tmp_path):
+        calls = []
+
+        class Collection1(dc.FileCollection):
+            def keys(self):
+                calls.append(1)
+                return ["a", "b"]
+
+            class Item(dd.ParquetDataset):
+                def create(self):
+                    return pd.DataFrame([{self.key: 1}])
+
+        class Collection2(dc.FileCollection):
+            def keys(self):
+                return ["a", "b"]
+
+            class Item(dd.ParquetDataset):
+                parents = [Collection1]
+
+                def create(self, collection):
+                    return pd.concat(collection.values(), axis=1)
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dt.create_task_graph([Collection1, Collection2], context)
+        assert len(calls) == 1
+
+
+class TestFingerprintStalenessCheck:
+    def should_reject_unknown_staleness_check(self, sample_data_classes):
+        with pytest.raises(ValueError):
+            dt.create_task_graph(
+                sample_data_classes.values(), {}, staleness_check="unknown"
+            )
+
+    def should_ignore_touched_datasets(self, sample_data_classes, tmp_path):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(),
+                context,
+                staleness_check="fingerprint",
+            )
+        )
+        update_times_1 = _obtain_last_update_times(
+            sample_data_classes.values(), context
+        )
+
+        # Touch a file without changing its contents
+        path = sample_data_classes["Collection1"].get("a1")(context).path()
+        stat = path.stat()
+        os.utime(path, (stat.st_atime + 10, stat.st_mtime + 10))
+
+        task_graph, _ = dt.create_task_graph(
+            sample_data_classes.values(),
+            context,
+            staleness_check="fingerprint",
+        )
+        dask.get(task_graph, list(task_graph))
+        update_times_2 = _obtain_last_update_times(
+            sample_data_classes.values(), context
+        )
+        for name, time_2 in update_times_2.items():
+            if name != "Collection1:a1":
+                assert time_2 == update_times_1[name]
+
+    def should_update_datasets_with_changed_inputs(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(),
+                context,
+                staleness_check="fingerprint",
+            )
+        )
+
+        # Change the contents of a file
+        item = sample_data_classes["Collection1"].get("a1")(context)
+        item.write(pd.DataFrame([{"a1": 3}]))
+
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(),
+                context,
+                staleness_check="fingerprint",
+            )
+        )
+        df = sample_data_classes["Collection2"].get("a1")(context).read()
+        assert df["a1"].tolist() == [6]
+
+    def should_fingerprint_each_parent_once_per_run(
+        self, tmp_path, monkeypatch
+    ):
+        class Parts(dc.FileCollection):
+            def keys(self):
+                return ["p1", "p2", "p3"]
+
+            class Item(dd.ParquetDataset):
+                def create(self):
+                    return pd.DataFrame({self.key: [1]})
+
+        class Aggregates(dc.FileCollection):
+            def keys(self):
+                return ["s1", "s2", "s3"]
+
+            class Item(dd.ParquetDataset):
+                parents = [Parts]
+
+                def create(self, parts):
+                    return pd.concat(parts.values(), axis=1)
+
+        fingerprinted = []
+        fingerprint = dd.FileDataset.fingerprint
+
+        def counting_fingerprint(self):
+            fingerprinted.append(self.name())
+            return fingerprint(self)
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = [Parts, Aggregates]
+        # Parts without manifests, whose contents must be hashed
+        dask.get(*dt.create_task_graph(data_classes, context))
+        for key in Aggregates(context).keys():
+            Aggregates.get(key)(context).path().unlink()
+
+        monkeypatch.setattr(dd.FileDataset, "fingerprint", counting_fingerprint)
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, staleness_check="fingerprint"
+            )
+        )
+        assert sorted(fingerprinted) == [
+            "Aggregates:s1",
+            "Aggregates:s2",
+            "Aggregates:s3",
+            "Parts:p1",
+            "Parts:p2",
+            "Parts:p3",
+        ]
+
+
+class TestCodeCheck:
+    def should_update_datasets_with_changed_code(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(), context, check_code=True
+            )
+        )
+        update_times_1 = _obtain_last_update_times(
+            sample_data_classes.values(), context
+        )
+
+        # Change the code recorded for Collection2:a1
+        item = sample_data_classes["Collection2"].get("a1")(context)
+        manifest = dm.read_manifest(item)
+        manifest["code_hash"] = "previous code"
+        with item.file_system.open(dm.manifest_path(item), "w") as file:
+            json.dump(manifest, file)
+
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(), context, check_code=True
+            )
+        )
+        update_times_2 = _obtain_last_update_times(
+            sample_data_classes.values(), context
+        )
+        for name, time_2 in update_times_2.items():
+            if name == "Collection2:a1":
+                assert time_2 > update_times_1[name]
+            else:
+                assert time_2 == update_times_1[name]
+
+    def should_not_fingerprint_datasets_for_code_checks(
+        self, sample_data_classes, tmp_path, monkeypatch
+    ):
+        def fail_fingerprint(self):
+            raise AssertionError("Unexpected fingerprint")
+
+        monkeypatch.setattr(dd.FileDataset, "fingerprint", fail_fingerprint)
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                sample_data_classes.values(), context, check_code=True
+            )
+        )
+        item = sample_data_classes["Collection2"].get("a1")(context)
+        manifest = dm.read_manifest(item)
+        assert set(manifest) == {"last_update_time", "code_hash"}
+        monkeypatch.undo()
+
+        # Such manifests fall back to update times with fingerprint checks
+        task_graph, _ = dt.create_task_graph(
+            sample_data_classes.values(),
+            context,
+            staleness_check="fingerprint",
+        )
+        assert all(task is None for task in task_graph.values())
+
+
+class TestCatalogManifest:
+    def should_skip_storage_checks_of_recorded_datasets(
+        self, sample_data_classes, tmp_path, mocker
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = sample_data_classes.values()
+
+        # Create all datasets, then record them in the manifest
+        for _ in range(2):
+            dask.get(
+                *dt.create_task_graph(
+                    data_classes, context, use_catalog_manifest=True
+                )
+            )
+        update_times_1 = _obtain_last_update_times(data_classes, context)
+
+        # Only the folder of source datasets, Collection1, is checked
+        listdir_details = mocker.spy(LocalFileSystem, "listdir_details")
+        info_many = mocker.spy(LocalFileSystem, "info_many")
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, use_catalog_manifest=True
+            )
+        )
+        assert [
+            str(call.args[1]) for call in listdir_details.call_args_list
+        ] == ["Collection1"]
+        assert info_many.call_count == 0
+        assert _obtain_last_update_times(data_classes, context) == (
+            update_times_1
+        )
+
+    def should_detect_source_datasets_changed_outside_task_graphs(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = sample_data_classes.values()
+        for _ in range(2):
+            dask.get(
+                *dt.create_task_graph(
+                    data_classes, context, use_catalog_manifest=True
+                )
+            )
+
+        # Overwrite a source dataset
+        item = sample_data_classes["Collection1"].get("a1")(context)
+        item.write(pd.DataFrame([{"a1": 5}, {"a1": 6}]))
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, use_catalog_manifest=True
+            )
+        )
+        df = sample_data_classes["Collection2"].get("a1")(context).read()
+        assert df["a1"].tolist() == [10, 12]
+
+        # Delete a source dataset
+        item.path().unlink()
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, use_catalog_manifest=True
+            )
+        )
+        df = sample_data_classes["Collection2"].get("a1")(context).read()
+        assert df["a1"].tolist() == [2]
+
+    def should_remove_datasets_to_update_from_manifest(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = sample_data_classes.values()
+        file_system = LocalFileSystem(tmp_path)
+        dataset_path = sample_data_classes["Dataset1"].catalog_path()
+
+        # All datasets are to be created: none is recorded
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, use_catalog_manifest=True
+            )
+        )
+        catalog_manifest = dm.CatalogManifest.load(file_system)
+        assert dataset_path not in catalog_manifest.entries
+
+        # All datasets exist and are recorded
+        dt.create_task_graph(data_classes, context, use_catalog_manifest=True)
+        catalog_manifest = dm.CatalogManifest.load(file_system)
+        assert dataset_path in catalog_manifest.entries
+        assert catalog_manifest.size(sample_data_classes["Dataset1"]) > 0
+
+        # A dataset to update is removed from the manifest
+        item = sample_data_classes["Collection1"].get("a1")(context)
+        catalog_manifest.discard(item)
+        catalog_manifest.save()
+        item.path().unlink()
+        dt.create_task_graph(data_classes, context, use_catalog_manifest=True)
+        catalog_manifest = dm.CatalogManifest.load(file_system)
+        assert item not in catalog_manifest
+        assert dataset_path not in catalog_manifest.entries
+
+
+class TestHybridDataTransfer:
+    def should_pass_large_data_through_storage(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        for _ in range(2):
+            # First created, then read from storage
+            results = dask.get(
+                *dt.create_task_graph(
+                    sample_data_classes.values(),
+                    context,
+                    targets=[sample_data_classes["Dataset1"]],
+                    in_memory_data_transfer=True,
+                    in_memory_max_bytes=1,
+                )
+            )
+            assert isinstance(results[0], dt.StoredData)
+            df = results[0].load()
+            assert set(df.columns) == {"a1", "a2", "b1", "b2"}
+
+    def should_follow_dataset_hints(self, tmp_path):
+        class Dataset1(dd.ParquetDataset):
+            in_memory_transfer = False
+
+            def create(self):
+                return pd.DataFrame({"a": [1]})
+
+        class Dataset2(dd.ParquetDataset):
+            parents = [Dataset1]
+            in_memory_transfer = True
+
+            def create(self, df):
+                return 2 * df
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, targets = dt.create_task_graph(
+            [Dataset1, Dataset2],
+            context,
+            in_memory_data_transfer=True,
+            in_memory_max_bytes=1,
+        )
+        results = dict(
+            zip([t.name() for t in targets], dask.get(task_graph, targets))
+        )
+        assert isinstance(results["Dataset1"], dt.StoredData)
+        assert results["Dataset2"]["a"].tolist() == [2]
+
+
+class TestColumnProjection:
+    @pytest.mark.parametrize("in_memory_data_transfer", [False, True])
+    def should_read_only_needed_parent_columns(
+        self, tmp_path, in_memory_data_transfer
+    ):
+        class Dataset1(dd.ParquetDataset):
+            in_memory_transfer = False
+
+            def create(self):
+                return pd.DataFrame({"a": [1, 2], "b": [3, 4]})
+
+        class Dataset2(dd.ParquetDataset):
+            parents = [Dataset1]
+            parent_columns = [["b"]]
+
+            def create(self, df):
+                assert list(df.columns) == ["b"]
+                return df
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                [Dataset1, Dataset2],
+                context,
+                in_memory_data_transfer=in_memory_data_transfer,
+            )
+        )
+        assert list(Dataset2(context).read().columns) == ["b"]
+
+
+class TestStreamingCreate:
+    @pytest.mark.parametrize("in_memory_data_transfer", [False, True])
+    def should_create_datasets_chunk_by_chunk(
+        self, tmp_path, in_memory_data_transfer
+    ):
+        class Dataset1(dd.ParquetDataset):
+            write_kwargs = {"index": False}
+            in_memory_transfer = False
+
+            def create(self):
+                return pd.DataFrame({"a": range(10)})
+
+        class Dataset2(dd.CsvDataset):
+            parents = [Dataset1]
+            write_kwargs = {"index": False}
+
+            def create_chunks(self, chunks):
+                for chunk in chunks:
+                    assert len(chunk) <= 3
+                    yield 2 * chunk
+
+        class Dataset3(dd.ParquetDataset):
+            parents = [Dataset2]
+
+            def create(self, df):
+                return df + 1
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_chunksize": 3,
+        }
+        dask.get(
+            *dt.create_task_graph(
+                [Dataset1, Dataset2, Dataset3],
+                context,
+                in_memory_data_transfer=in_memory_data_transfer,
+            )
+        )
+        expected = [2 * i + 1 for i in range(10)]
+        assert Dataset3(context).read()["a"].tolist() == expected
+
+    def should_read_parents_without_chunked_reads_at_once(self, tmp_path):
+        class Dataset1(dd.PickleDataset):
+            def create(self):
+                return pd.DataFrame({"a": range(10)})
+
+        class Dataset2(dd.ParquetDataset):
+            parents = [Dataset1]
+
+            def create_chunks(self, chunks):
+                for chunk in chunks:
+                    yield 2 * chunk
+
+        context = {
+            "catalog_uri": tmp_path.absolute().as_uri(),
+            "read_chunksize": 3,
+        }
+        dask.get(*dt.create_task_graph([Dataset1, Dataset2], context))
+        expected = [2 * i for i in range(10)]
+        assert Dataset2(context).read()["a"].tolist() == expected
+
+
+class TestItemBatching:
+    @pytest.mark.parametrize("in_memory_data_transfer", [False, True])
+    def should_create_items_in_batches(
+        self, sample_data_classes, tmp_path, in_memory_data_transfer
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, targets = dt.create_task_graph(
+            sample_data_classes.values(),
+            context,
+            in_memory_data_transfer=in_memory_data_transfer,
+            batch_size=3,
+        )
+        batches = [key for key in task_graph if isinstance(key, dt.ItemBatch)]
+        # Collections 1 and 2 have 4 items each, Collection3 has 2 items
+        assert sorted(len(batch.items) for batch in batches) == [2, 3, 3]
+        for batch in batches:
+            assert not any(item in task_graph for item in batch.items)
+        dask.get(task_graph, targets)
+
+        df = sample_data_classes["Dataset1"](context).read()
+        assert df.columns.tolist() == ["a1", "a2", "b1", "b2"]
+        df = sample_data_classes["Collection3"].get("b")(context).read()
+        assert df.columns.tolist() == ["b1", "b2"]
+        df = sample_data_classes["Collection2"].get("a2")(context).read()
+        assert df["a2"].tolist() == [2]
+
+    def should_return_batch_results_for_targets(
+        self, sample_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, targets = dt.create_task_graph(
+            sample_data_classes.values(),
+            context,
+            targets=[sample_data_classes["Collection1"]],
+            in_memory_data_transfer=True,
+            batch_size=10,
+        )
+        assert len(targets) == 1
+        (results,) = dask.get(task_graph, targets)
+        assert {item.name() for item in results} == {
+            "Collection1:a1",
+            "Collection1:a2",
+            "Collection1:b1",
+            "Collection1:b2",
+        }
+
+
+@pytest.fixture
+def ephemeral_data_classes():
+    class Source(dd.ParquetDataset):
+        def create(self):
+            return pd.DataFrame({"a": [1, 2, 3]})
+
+    class Doubled(dd.ParquetDataset):
+        parents = [Source]
+        ephemeral = True
+
+        def create(self, df):
+            return 2 * df
+
+    class Shifted(dd.ParquetDataset):
+        parents = [Doubled]
+        ephemeral = True
+
+        def create(self, df):
+            return df + 1
+
+    class Final(dd.ParquetDataset):
+        parents = [Shifted]
+
+        def create(self, df):
+            return df
+
+    return {
+        "Source": Source,
+        "Doubled": Doubled,
+        "Shifted": Shifted,
+        "Final": Final,
+    }
+
+
+class TestEphemeralDatasets:
+    @pytest.mark.parametrize("in_memory_data_transfer", [False, True])
+    def should_create_children_without_storing_ephemeral_datasets(
+        self, ephemeral_data_classes, tmp_path, in_memory_data_transfer
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                ephemeral_data_classes.values(),
+                context,
+                in_memory_data_transfer=in_memory_data_transfer,
+            )
+        )
+        df = ephemeral_data_classes["Final"](context).read()
+        assert df["a"].tolist() == [3, 5, 7]
+        assert not ephemeral_data_classes["Doubled"](context).exists()
+        assert not ephemeral_data_classes["Shifted"](context).exists()
+
+    def should_fuse_ephemeral_datasets_into_children(
+        self, ephemeral_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_graph, _ = dt.create_task_graph(
+            ephemeral_data_classes.values(), context
+        )
+        assert {data_object.name() for data_object in task_graph} == {
+            "Source",
+            "Final",
+        }
+
+    @pytest.mark.parametrize("staleness_check", ["mtime", "fingerprint"])
+    def should_recreate_children_only_when_ancestors_change(
+        self, ephemeral_data_classes, tmp_path, staleness_check
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        data_classes = ephemeral_data_classes.values()
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, staleness_check=staleness_check
+            )
+        )
+
+        # Nothing changed: nothing to do
+        task_graph, _ = dt.create_task_graph(
+            data_classes, context, staleness_check=staleness_check
+        )
+        assert all(task is None for task in task_graph.values())
+
+        # The source changed: the ephemeral datasets are recomputed
+        ephemeral_data_classes["Source"](context).write(
+            pd.DataFrame({"a": [0]})
+        )
+        dask.get(
+            *dt.create_task_graph(
+                data_classes, context, staleness_check=staleness_check
+            )
+        )
+        df = ephemeral_data_classes["Final"](context).read()
+        assert df["a"].tolist() == [1]
+
+    def should_return_ephemeral_targets(
+        self, ephemeral_data_classes, tmp_path
+    ):
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        (df,) = dask.get(
+            *dt.create_task_graph(
+                ephemeral_data_classes.values(),
+                context,
+                targets=[ephemeral_data_classes["Doubled"]],
+            )
+        )
+        assert df["a"].tolist() == [2, 4, 6]
+        assert not ephemeral_data_classes["Doubled"](context).exists()
+
+    def should_batch_children_of_ephemeral_items(self, tmp_path):
+        class Source(dc.FileCollection):
+            def keys(self):
+                return ["a", "b", "c"]
+
+            class Item(dd.ParquetDataset):
+                def create(self):
+                    return pd.DataFrame({self.key: [1]})
+
+        class Doubled(dc.FileCollection):
+            def keys(self):
+                return ["a", "b", "c"]
+
+            class Item(dd.ParquetDataset):
+                parents = [dc.same_key_in(Source)]
+                ephemeral = True
+
+                def create(self, df):
+                    return 2 * df
+
+        class Final(dc.FileCollection):
+            def keys(self):
+                return ["a", "b", "c"]
+
+            class Item(dd.ParquetDataset):
+                parents = [dc.same_key_in(Doubled)]
+
+                def create(self, df):
+                    return df
+
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(
+            *dt.create_task_graph(
+                [Source, Doubled, Final], context, batch_size=10
+            )
+        )
+        assert Final.get("b")(context).read()["b"].tolist() == [2]
+        assert not Doubled.get("b")(context).exists()
+
+
+@pytest.fixture
+def fan_in_data_classes():
+    class Parts(dc.FileCollection):
+        def keys(self):
+            return ["p1", "p2", "p3", "p4"]
+
+        class Item(dd.ParquetDataset):
+            def create(self):
+                return pd.DataFrame({self.key: [1, 2]})
+
+    class Total(dd.ParquetDataset):
+        parents = [Parts]
+
+        def create(self, parts):
+            return pd.concat(parts.values(), axis=1)
+
+    return Parts, Total
+
+
+class TestMemoryBudget:
+    def _stored_outputs(self, task_graph):
+        results = dask.get(task_graph, list(task_graph))
+        return {
+            key.name()
+            for key, result in zip(task_graph, results)
+            if isinstance(result, dt.StoredData)
+        }
+
+    def should_spill_outputs_over_budget(self, fan_in_data_classes, tmp_path):
+        Parts, Total = fan_in_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_stats = ds.TaskStats.from_context(context)
+        for key in Parts(context).keys():
+            task_stats.record(Parts.get(key)(context), 1.0, memory_size=100)
+
+        task_graph, targets = dt.create_task_graph(
+            [Parts, Total],
+            context,
+            targets=[Total],
+            in_memory_data_transfer=True,
+            memory_budget=250,
+            task_stats=task_stats,
+        )
+        # The four parts are held until Total is created: two must be spilled
+        assert len(self._stored_outputs(task_graph)) == 2
+        df = Total(context).read()
+        assert df.columns.tolist() == ["p1", "p2", "p3", "p4"]
+
+    def should_keep_outputs_within_budget(self, fan_in_data_classes, tmp_path):
+        Parts, Total = fan_in_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        task_stats = ds.TaskStats.from_context(context)
+        for key in Parts(context).keys():
+            task_stats.record(Parts.get(key)(context), 1.0, memory_size=100)
+
+        task_graph, _ = dt.create_task_graph(
+            [Parts, Total],
+            context,
+            in_memory_data_transfer=True,
+            memory_budget=1000,
+            task_stats=task_stats,
+        )
+        assert not self._stored_outputs(task_graph)
+
+    def should_estimate_sizes_from_files(self, fan_in_data_classes, tmp_path):
+        Parts, Total = fan_in_data_classes
+        context = {"catalog_uri": tmp_path.absolute().as_uri()}
+        dask.get(*dt.create_task_graph([Parts, Total], context))
+        Total(context).path().unlink()
+
+        # Parts are read from storage, their files exceed the budget
+        task_graph, _ = dt.create_task_graph(
+            [Parts, Total],
+            context,
+            targets=[Total],
+            in_memory_data_transfer=True,
+            memory_budget=1,
+        )
+        assert self._stored_outputs(task_graph) == {
+            "Parts:p1",
+            "Parts:p2",
+            "Parts:p3",
+            "Parts:p4",
+        }
+        df = Total(context).read()
+        assert df.columns.tolist() == ["p1", "p2", "p3", "p4"]
@@ -2,6 +2,8 @@ import sys
 import pytest
 from pathlib import Path
 
+import pandas as pd
+
 import data_catalog
 import data_catalog.datasets as ds
 import data_catalog.utils as du
@@ -24,6 +26,17 @@ class TestFindMandatoryArguments:
         assert arguments == ["a", "b", "c"]
 
 
+class TestEstimateSize:
+    def should_measure_dataframes(self):
+        df = pd.DataFrame({"a": range(1000)})
+        assert du.estimate_size(df) >= 8000
+        assert du.estimate_size({"df": df}) > du.estimate_size(df)
+
+    def should_measure_other_objects(self):
+        assert du.estimate_size([1, 2]) > du.estimate_size([])
+        assert du.estimate_size("abc") > 0
+
+
 class TestKeysFromFolder:
     def should_list_filenames_without_extension(self):
         class ClassWithFileSystem: